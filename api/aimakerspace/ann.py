@@ -0,0 +1,161 @@
+import numpy as np
+from typing import List, Optional, Tuple
+from aimakerspace.vector_math import normalize, top_k_indices
+
+
+def _assign(data, centroids: np.ndarray, block: int = 16384) -> np.ndarray:
+    """Nearest centroid (by inner product) for every row, in bounded blocks.
+
+    ``data`` is a float matrix or a :class:`MatrixStore`, whose rows are
+    decoded block by block.
+    """
+    size = len(data)
+    decode = data.decode if hasattr(data, "decode") else data.__getitem__
+    assignment = np.empty(size, dtype=np.int64)
+    for start in range(0, size, block):
+        scores = decode(slice(start, min(start + block, size))) @ centroids.T
+        assignment[start : start + block] = np.argmax(scores, axis=1)
+    return assignment
+
+
+def spherical_kmeans(
+    data: np.ndarray, n_clusters: int, n_iter: int = 10, seed: int = 0
+) -> np.ndarray:
+    """Clusters unit vectors and returns unit-length centroids."""
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, data.shape[0])
+    centroids = data[rng.choice(data.shape[0], n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assignment = _assign(data, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, data)
+        counts = np.bincount(assignment, minlength=n_clusters)
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            # Re-seed empty clusters so every list stays useful
+            sums[empty] = data[rng.choice(data.shape[0], empty.size, replace=False)]
+        centroids = normalize(sums)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index over the rows of a :class:`MatrixStore`.
+
+    Rows are bucketed by their nearest k-means centroid. A query scores the
+    centroids, then only the rows in the ``nprobe`` closest buckets. Raising
+    ``nprobe`` trades latency for recall; ``nprobe == nlist`` is exact.
+    """
+
+    def __init__(
+        self,
+        nlist: int = 256,
+        nprobe: int = 8,
+        min_train_size: Optional[int] = None,
+        train_sample_size: Optional[int] = None,
+        n_iter: int = 10,
+        seed: int = 0,
+    ):
+        """
+        :param nlist: Number of k-means centroids (inverted lists).
+        :param nprobe: Number of lists scanned per query.
+        :param min_train_size: Row count at which the index trains itself;
+            until then searches fall back to an exact scan.
+        :param train_sample_size: Rows sampled for k-means (default ``64 * nlist``).
+        """
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size or 4 * nlist
+        self.train_sample_size = train_sample_size or 64 * nlist
+        self.n_iter = n_iter
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: List[List[int]] = []
+        self.row_to_list: dict = {}
+        self._arrays: dict = {}
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, store) -> None:
+        """Fits centroids on a sample of ``store`` and assigns every row."""
+        rng = np.random.default_rng(self.seed)
+        size = len(store)
+        if size > self.train_sample_size:
+            sample = store.decode(
+                np.sort(rng.choice(size, self.train_sample_size, replace=False))
+            )
+        else:
+            sample = store.decode(slice(0, size))
+        self.centroids = spherical_kmeans(
+            np.asarray(sample, dtype=np.float32), self.nlist, self.n_iter, self.seed
+        )
+        self.lists = [[] for _ in range(self.centroids.shape[0])]
+        self.row_to_list = {}
+        self._arrays = {}
+        for row, list_id in enumerate(_assign(store, self.centroids)):
+            self.lists[list_id].append(row)
+            self.row_to_list[row] = int(list_id)
+
+    def assignment(self, size: int) -> np.ndarray:
+        """List id of each of the first ``size`` rows (``-1`` if unassigned)."""
+        assignment = np.full(size, -1, dtype=np.int32)
+        rows = np.fromiter(self.row_to_list.keys(), dtype=np.int64, count=len(self.row_to_list))
+        list_ids = np.fromiter(self.row_to_list.values(), dtype=np.int32, count=len(self.row_to_list))
+        live = rows < size
+        assignment[rows[live]] = list_ids[live]
+        return assignment
+
+    def restore(self, centroids: np.ndarray, assignment: np.ndarray) -> None:
+        """Reinstates a trained index from :meth:`assignment` output."""
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        assignment = np.asarray(assignment)
+        rows = np.flatnonzero(assignment >= 0)
+        list_ids = assignment[rows]
+        order = np.argsort(list_ids, kind="stable")
+        bounds = np.cumsum(np.bincount(list_ids, minlength=self.centroids.shape[0]))
+        self.lists = [chunk.tolist() for chunk in np.split(rows[order], bounds[:-1])]
+        self.row_to_list = dict(zip(rows.tolist(), list_ids.tolist()))
+        self._arrays = {}
+
+    def add(self, row: int, vector: np.ndarray) -> None:
+        """Files a new (or overwritten) row under its nearest centroid."""
+        list_id = int(np.argmax(self.centroids @ vector))
+        previous = self.row_to_list.get(row)
+        if previous == list_id:
+            return
+        if previous is not None:
+            self.lists[previous].remove(row)
+            self._arrays.pop(previous, None)
+        self.lists[list_id].append(row)
+        self.row_to_list[row] = list_id
+        self._arrays.pop(list_id, None)
+
+    def remove(self, row: int) -> None:
+        list_id = self.row_to_list.pop(row, None)
+        if list_id is not None:
+            self.lists[list_id].remove(row)
+            self._arrays.pop(list_id, None)
+
+    def _list_array(self, list_id: int) -> np.ndarray:
+        array = self._arrays.get(list_id)
+        if array is None:
+            array = np.asarray(self.lists[list_id], dtype=np.int64)
+            self._arrays[list_id] = array
+        return array
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """Row ids stored in the ``nprobe`` lists closest to ``query``."""
+        nprobe = min(nprobe or self.nprobe, len(self.lists))
+        probed = top_k_indices(self.centroids @ query, nprobe)
+        arrays = [self._list_array(int(i)) for i in probed]
+        return np.concatenate(arrays) if arrays else np.empty(0, dtype=np.int64)
+
+    def search(
+        self, store, query: np.ndarray, k: int, nprobe: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns ``(rows, scores)`` of the approximate top ``k``, best first."""
+        rows = self.candidates(query, nprobe)
+        scores = store.score_rows(rows, query)
+        top = top_k_indices(scores, k)
+        return rows[top], scores[top]
@@ -0,0 +1,176 @@
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import math
+import re
+
+import numpy as np
+
+from aimakerspace.stopwords import ENGLISH_STOPWORDS
+from aimakerspace.vector_math import top_k_indices
+
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens of ``text`` without English stopwords."""
+    return [word for word in _WORD.findall(text.lower()) if word not in ENGLISH_STOPWORDS]
+
+
+def reciprocal_rank_fusion(
+    rankings: Iterable[Sequence[str]],
+    k: int = 60,
+    weights: Optional[Sequence[float]] = None,
+) -> List[Tuple[str, float]]:
+    """Fuses ranked key lists by reciprocal rank fusion, best first.
+
+    Each list contributes ``weight / (k + rank)`` (rank starting at 1) to
+    every key it contains. Only ranks are used, so lexical and vector
+    scores on different scales can be combined without calibration.
+    """
+    fused: Dict[str, float] = {}
+    rankings = list(rankings)
+    weights = weights or [1.0] * len(rankings)
+    for ranking, weight in zip(rankings, weights):
+        for rank, key in enumerate(ranking, 1):
+            fused[key] = fused.get(key, 0.0) + weight / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """Okapi BM25 over an in-memory inverted index.
+
+    Each term's postings are two packed ``array('I')`` columns (document
+    numbers in insertion order and term frequencies), about 8 bytes per
+    posting. Scoring reads them as NumPy views and scores every matching
+    document at once. Re-adding a key or :meth:`remove` leaves a tombstone;
+    its postings are skipped and the document no longer counts towards the
+    collection statistics.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.keys: List[Optional[str]] = []  # document number -> key (None once removed)
+        self.key_to_doc: Dict[str, int] = {}
+        self.lengths = array("I")  # tokens per document, 0 once removed
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.key_to_doc)
+
+    def add(self, key: str, text: str) -> None:
+        """Indexes ``text`` under ``key``, replacing any previous text."""
+        self.remove(key)
+        doc = len(self.keys)
+        counts: Dict[str, int] = {}
+        tokens = tokenize(text)
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for term, count in counts.items():
+            docs, freqs = self.postings.setdefault(term, (array("I"), array("I")))
+            docs.append(doc)
+            freqs.append(count)
+        self.keys.append(key)
+        self.key_to_doc[key] = doc
+        self.lengths.append(len(tokens))
+        self._total_length += len(tokens)
+
+    def remove(self, key: str) -> None:
+        doc = self.key_to_doc.pop(key, None)
+        if doc is None:
+            return
+        self._total_length -= self.lengths[doc]
+        self.lengths[doc] = 0
+        self.keys[doc] = None
+
+    def _postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        postings = self.postings.get(term)
+        if postings is None:
+            return None
+        docs, freqs = postings
+        return np.frombuffer(docs, dtype=np.uintc), np.frombuffer(freqs, dtype=np.uintc)
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every document number for ``query`` (0 = no match)."""
+        n_docs = len(self.key_to_doc)
+        scores = np.zeros(len(self.keys), dtype=np.float32)
+        if not n_docs:
+            return scores
+        lengths = np.frombuffer(self.lengths, dtype=np.uintc).astype(np.float32)
+        average_length = max(self._total_length / n_docs, 1.0)
+        norms = self.k1 * (1 - self.b + self.b * lengths / average_length)
+        # Removed documents have length 0; so do empty ones, which match nothing
+        live = lengths > 0
+        for term in set(tokenize(query)):
+            postings = self._postings(term)
+            if postings is None:
+                continue
+            docs, freqs = postings
+            docs, freqs = docs[live[docs]], freqs[live[docs]].astype(np.float32)
+            if not len(docs):
+                continue
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * freqs * (self.k1 + 1) / (freqs + norms[docs])
+        return scores
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """The ``k`` best-scoring keys for ``query``, best first."""
+        scores = self.scores(query)
+        top = top_k_indices(scores, k)
+        return [(self.keys[doc], float(scores[doc])) for doc in top if scores[doc] > 0]
+
+    def matching(self, query: str, require_all: bool = True) -> List[str]:
+        """Keys of documents containing every (or, if not ``require_all``,
+        any) term of ``query``; empty if ``query`` has no indexable terms."""
+        docs = None
+        for term in set(tokenize(query)):
+            postings = self._postings(term)
+            term_docs = postings[0] if postings is not None else np.empty(0, dtype=np.uintc)
+            if docs is None:
+                docs = term_docs
+            elif require_all:
+                docs = np.intersect1d(docs, term_docs, assume_unique=True)
+            else:
+                docs = np.union1d(docs, term_docs)
+        if docs is None:
+            return []
+        return [self.keys[doc] for doc in docs if self.keys[doc] is not None]
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Flat arrays for ``np.savez``; see :meth:`from_arrays`. Keys are
+        left out: callers usually store them already, e.g. as row ids."""
+        terms = list(self.postings)
+        sizes = [len(self.postings[term][0]) for term in terms]
+        empty = np.empty(0, dtype=np.uintc)
+        return {
+            # Tokens are \w+ runs, so a newline can separate them
+            "terms": np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8),
+            "offsets": np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64),
+            "docs": np.concatenate([np.frombuffer(self.postings[t][0], dtype=np.uintc) for t in terms] or [empty]),
+            "freqs": np.concatenate([np.frombuffer(self.postings[t][1], dtype=np.uintc) for t in terms] or [empty]),
+            "lengths": np.frombuffer(self.lengths, dtype=np.uintc).copy(),
+        }
+
+    @classmethod
+    def from_arrays(
+        cls,
+        arrays,
+        keys: List[Optional[str]],
+        k1: float = 1.5,
+        b: float = 0.75,
+    ) -> "BM25Index":
+        """Rebuilds an index from :meth:`to_arrays` output and ``keys``, its
+        document number -> key list (``None`` for removed documents)."""
+        index = cls(k1=k1, b=b)
+        offsets = arrays["offsets"]
+        docs, freqs = arrays["docs"].astype(np.uintc), arrays["freqs"].astype(np.uintc)
+        blob = arrays["terms"].tobytes().decode("utf-8")
+        for i, term in enumerate(blob.split("\n") if blob else []):
+            start, stop = offsets[i], offsets[i + 1]
+            index.postings[term] = (array("I", docs[start:stop].tobytes()), array("I", freqs[start:stop].tobytes()))
+        index.lengths = array("I", arrays["lengths"].astype(np.uintc).tobytes())
+        index.keys = list(keys)
+        index.key_to_doc = {key: doc for doc, key in enumerate(index.keys) if key is not None}
+        index._total_length = sum(index.lengths[doc] for doc in index.key_to_doc.values())
+        return index
@@ -0,0 +1,177 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Set
+import asyncio
+
+from aimakerspace.openai_utils.resilience import RetryPolicy
+from aimakerspace.openai_utils.tokenizer import aget_encoding, count_tokens
+
+
+def plan_batches(
+    texts: Sequence[str],
+    max_inputs: int,
+    max_tokens: int,
+    model_name: str = "text-embedding-3-small",
+) -> List[range]:
+    """Splits ``texts`` into consecutive index ranges within both limits.
+
+    A single text larger than ``max_tokens`` still gets a batch of its own;
+    the API is left to reject it.
+    """
+    batches = []
+    start, tokens = 0, 0
+    for i, text in enumerate(texts):
+        text_tokens = count_tokens(text, model_name)
+        if i > start and (i - start >= max_inputs or tokens + text_tokens > max_tokens):
+            batches.append(range(start, i))
+            start, tokens = i, 0
+        tokens += text_tokens
+    if start < len(texts):
+        batches.append(range(start, len(texts)))
+    return batches
+
+
+class EmbeddingBatcher:
+    """Embeds long input lists as bounded, concurrent, retried batches.
+
+    Inputs are cut into batches of at most ``max_batch_inputs`` texts and
+    ``max_batch_tokens`` tokens. Async runs keep at most ``max_concurrency``
+    batches in flight. A batch that fails with a retryable error is retried
+    up to ``max_retries`` times with jittered exponential backoff (see
+    :class:`RetryPolicy`). Results
+    always come back in input order.
+    """
+
+    def __init__(
+        self,
+        max_batch_inputs: int = 2048,
+        max_batch_tokens: int = 250_000,
+        max_concurrency: int = 4,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        model_name: str = "text-embedding-3-small",
+    ):
+        self.max_batch_inputs = max_batch_inputs
+        self.max_batch_tokens = max_batch_tokens
+        self.max_concurrency = max_concurrency
+        self.retry = RetryPolicy(max_retries=max_retries, backoff_base=backoff_base)
+        self.model_name = model_name
+
+    def _plan(self, texts: Sequence[str]) -> List[range]:
+        return plan_batches(
+            texts, self.max_batch_inputs, self.max_batch_tokens, self.model_name
+        )
+
+    async def run(
+        self,
+        texts: Sequence[str],
+        embed_batch: Callable[[List[str]], Awaitable[List[List[float]]]],
+    ) -> List[List[float]]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run_batch(batch: range) -> List[List[float]]:
+            inputs = [texts[i] for i in batch]
+            async with semaphore:
+                return await self.retry.call(lambda: embed_batch(inputs))
+
+        # Planning counts tokens; load the encoding without blocking the loop
+        await aget_encoding(self.model_name)
+        results = await asyncio.gather(*(run_batch(batch) for batch in self._plan(texts)))
+        return [vector for batch_result in results for vector in batch_result]
+
+    def run_sync(
+        self,
+        texts: Sequence[str],
+        embed_batch: Callable[[List[str]], List[List[float]]],
+    ) -> List[List[float]]:
+        """Blocking counterpart of :meth:`run`; batches are sent one at a time."""
+        vectors = []
+        for batch in self._plan(texts):
+            inputs = [texts[i] for i in batch]
+            vectors.extend(self.retry.call_sync(lambda: embed_batch(inputs)))
+        return vectors
+
+
+class EmbeddingCoalescer:
+    """Merges concurrent single-text embedding requests into batched calls.
+
+    The first :meth:`embed` call opens a window of ``window_s`` seconds;
+    texts requested meanwhile join its batch, which is sent as one
+    ``embed_batch`` call when the window closes or the batch reaches
+    ``max_batch_inputs`` texts. A text already waiting or in flight is not
+    sent again: its callers share one result. ``window_s=0`` merges only
+    requests made in the same event-loop iteration.
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], Awaitable[List[List[float]]]],
+        window_s: float = 0.002,
+        max_batch_inputs: int = 64,
+    ):
+        self.embed_batch = embed_batch
+        self.window_s = window_s
+        self.max_batch_inputs = max_batch_inputs
+        self._waiting: Dict[str, asyncio.Future] = {}
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.requests = 0
+        self.deduplicated = 0
+        self.batches = 0
+        self.texts_sent = 0
+
+    async def embed(self, text: str) -> List[float]:
+        self.requests += 1
+        future = self._waiting.get(text) or self._in_flight.get(text)
+        if future is not None:
+            self.deduplicated += 1
+        else:
+            loop = asyncio.get_running_loop()
+            future = self._waiting[text] = loop.create_future()
+            if len(self._waiting) >= self.max_batch_inputs:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window_s, self._flush)
+        # One caller giving up must not cancel the result for the others
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._waiting = self._waiting, {}
+        if not batch:
+            return
+        self._in_flight.update(batch)
+        task = asyncio.get_running_loop().create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: Dict[str, asyncio.Future]) -> None:
+        texts = list(batch)
+        self.batches += 1
+        self.texts_sent += len(texts)
+        try:
+            vectors = await self.embed_batch(texts)
+        except BaseException as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        else:
+            for future, vector in zip(batch.values(), vectors):
+                if not future.done():
+                    future.set_result(vector)
+        finally:
+            for text, future in batch.items():
+                if self._in_flight.get(text) is future:
+                    del self._in_flight[text]
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "deduplicated": self.deduplicated,
+            "batches": self.batches,
+            "texts_sent": self.texts_sent,
+            "mean_batch_size": round(self.texts_sent / self.batches, 2) if self.batches else 0.0,
+        }
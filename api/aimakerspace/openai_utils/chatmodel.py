@@ -1,43 +1,118 @@
 from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
+from typing import Optional
+import asyncio
 import os
 
+from aimakerspace.openai_utils.resilience import RetryPolicy
+
 load_dotenv()
 
 
 class ChatOpenAI:
-    def __init__(self, model_name: str = "gpt-4o-mini"):
+    def __init__(
+        self,
+        model_name: str = "gpt-4o-mini",
+        client: Optional[OpenAI] = None,
+        async_client: Optional[AsyncOpenAI] = None,
+        retry: Optional[RetryPolicy] = None,
+        timeout_s: Optional[float] = None,
+        first_token_timeout_s: Optional[float] = None,
+        idle_timeout_s: Optional[float] = None,
+    ):
+        """
+        :param client: Shared ``OpenAI`` client; created on first use if omitted.
+        :param async_client: Shared ``AsyncOpenAI`` client; created on first
+            use if omitted.
+        :param retry: Retries of failed requests; :meth:`astream` only
+            retries until the first token is out. Clients created here leave
+            retrying to it.
+        :param timeout_s: Deadline of one :meth:`run` request.
+        :param first_token_timeout_s: How long :meth:`astream` waits for the
+            first token before giving up on (and retrying) the request.
+        :param idle_timeout_s: Longest gap between later streamed tokens.
+        """
         self.model_name = model_name
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
+        self._client = client
+        self._async_client = async_client
+        self.retry = retry or RetryPolicy()
+        self.timeout_s = timeout_s
+        self.first_token_timeout_s = first_token_timeout_s
+        self.idle_timeout_s = idle_timeout_s
+
+    @property
+    def client(self) -> OpenAI:
+        if self._client is None:
+            self._client = OpenAI(max_retries=0)
+        return self._client
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(max_retries=0)
+        return self._async_client
 
     def run(self, messages, text_only: bool = True, **kwargs):
         if not isinstance(messages, list):
             raise ValueError("messages must be a list")
+        if self.timeout_s is not None:
+            kwargs.setdefault("timeout", self.timeout_s)
 
-        client = OpenAI()
-        response = client.chat.completions.create(
-            model=self.model_name, messages=messages, **kwargs
+        response = self.retry.call_sync(
+            lambda: self.client.chat.completions.create(
+                model=self.model_name, messages=messages, **kwargs
+            )
         )
 
         if text_only:
             return response.choices[0].message.content
 
         return response
-    
-    async def astream(self, messages, **kwargs):
-        if not isinstance(messages, list):
-            raise ValueError("messages must be a list")
-        
-        client = AsyncOpenAI()
 
-        stream = await client.chat.completions.create(
+    async def _open_stream(self, messages, kwargs):
+        """Starts a streamed completion and reads up to its first token.
+
+        Returns the stream, its chunk iterator and the first token (``None``
+        if the answer is empty).
+        """
+        stream = await self.async_client.chat.completions.create(
             model=self.model_name,
             messages=messages,
             stream=True,
             **kwargs
         )
+        try:
+            chunks = stream.__aiter__()
+            async for chunk in chunks:
+                content = chunk.choices[0].delta.content
+                if content is not None:
+                    return stream, chunks, content
+            return stream, chunks, None
+        except BaseException:
+            await stream.close()
+            raise
+
+    async def astream(self, messages, **kwargs):
+        if not isinstance(messages, list):
+            raise ValueError("messages must be a list")
 
-        async for chunk in stream:
-            content = chunk.choices[0].delta.content
-            if content is not None:
-                yield content
+        # Nothing has reached the caller before the first token, so a slow
+        # or failed start can be retried
+        stream, chunks, content = await self.retry.call(
+            lambda: self._open_stream(messages, kwargs), attempt_timeout=self.first_token_timeout_s
+        )
+        try:
+            if content is None:
+                return
+            yield content
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), self.idle_timeout_s)
+                except StopAsyncIteration:
+                    return
+                content = chunk.choices[0].delta.content
+                if content is not None:
+                    yield content
+        finally:
+            await stream.close()
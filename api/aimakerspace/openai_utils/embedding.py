@@ -1,47 +1,160 @@
 from dotenv import load_dotenv
 from openai import AsyncOpenAI, OpenAI
 import openai
-from typing import List
+from typing import List, Optional
 import os
 import asyncio
+from aimakerspace.openai_utils.embedding_cache import EmbeddingCache
+from aimakerspace.openai_utils.batching import EmbeddingBatcher, EmbeddingCoalescer
+from aimakerspace.openai_utils.resilience import Hedger
 
 
 class EmbeddingModel:
-    def __init__(self, embeddings_model_name: str = "text-embedding-3-small"):
+    def __init__(
+        self,
+        embeddings_model_name: str = "text-embedding-3-small",
+        cache: Optional[EmbeddingCache] = None,
+        batcher: Optional[EmbeddingBatcher] = None,
+        client: Optional[OpenAI] = None,
+        async_client: Optional[AsyncOpenAI] = None,
+        coalesce_window_s: Optional[float] = None,
+        coalesce_max_inputs: int = 64,
+        query_timeout_s: Optional[float] = None,
+        hedger: Optional[Hedger] = None,
+    ):
+        """
+        :param cache: Optional :class:`EmbeddingCache`. When set, only texts
+            missing from the cache are sent to the API.
+        :param batcher: Splits multi-text requests into API-sized batches and
+            runs them concurrently with retries; a default one is used if
+            omitted.
+        :param client: Shared ``OpenAI`` client; created on first use if omitted.
+        :param async_client: Shared ``AsyncOpenAI`` client; created on first
+            use if omitted. Clients created here leave retrying to the
+            batcher.
+        :param coalesce_window_s: If set, concurrent :meth:`async_get_embedding`
+            cache misses within this window (or up to ``coalesce_max_inputs``
+            texts) are sent as one batched request; see
+            :class:`EmbeddingCoalescer`.
+        :param query_timeout_s: Deadline of an :meth:`async_get_embedding`
+            request, retries included.
+        :param hedger: Optional :class:`Hedger` for :meth:`async_get_embedding`
+            requests: a slow one gets a duplicate and the first answer wins.
+        """
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
-        self.async_client = AsyncOpenAI()
-        self.client = OpenAI()
+        self._client = client
+        self._async_client = async_client
 
         openai.api_key = self.openai_api_key
         self.embeddings_model_name = embeddings_model_name
+        self.cache = cache
+        self.batcher = batcher or EmbeddingBatcher(model_name=embeddings_model_name)
+        self.query_timeout_s = query_timeout_s
+        self.hedger = hedger
+        self.coalescer = (
+            EmbeddingCoalescer(
+                self._async_fetch, window_s=coalesce_window_s, max_batch_inputs=coalesce_max_inputs
+            )
+            if coalesce_window_s is not None
+            else None
+        )
 
-    async def async_get_embeddings(self, list_of_text: List[str]) -> List[List[float]]:
-        embedding_response = await self.async_client.embeddings.create(
-            input=list_of_text, model=self.embeddings_model_name
+    @property
+    def client(self) -> OpenAI:
+        if self._client is None:
+            self._client = OpenAI(max_retries=0)
+        return self._client
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(max_retries=0)
+        return self._async_client
+
+    @staticmethod
+    def _misses(list_of_text: List[str], cached) -> List[str]:
+        """The unique texts without a cached result."""
+        return list(
+            dict.fromkeys(
+                text for text, vector in zip(list_of_text, cached) if vector is None
+            )
         )
 
-        return [embeddings.embedding for embeddings in embedding_response.data]
+    @staticmethod
+    def _merge_fetched(list_of_text, cached, missing, fetched) -> List[List[float]]:
+        by_text = dict(zip(missing, fetched))
+        return [
+            vector if vector is not None else by_text[text]
+            for text, vector in zip(list_of_text, cached)
+        ]
 
-    async def async_get_embedding(self, text: str) -> List[float]:
-        embedding = await self.async_client.embeddings.create(
-            input=text, model=self.embeddings_model_name
+    async def _async_create(self, list_of_text: List[str]) -> List[List[float]]:
+        return await self.batcher.run(list_of_text, self._async_embed_batch)
+
+    def _create(self, list_of_text: List[str]) -> List[List[float]]:
+        return self.batcher.run_sync(list_of_text, self._embed_batch)
+
+    async def _async_embed_batch(self, list_of_text: List[str]) -> List[List[float]]:
+        embedding_response = await self.async_client.embeddings.create(
+            input=list_of_text, model=self.embeddings_model_name
         )
 
-        return embedding.data[0].embedding
+        return [embeddings.embedding for embeddings in embedding_response.data]
 
-    def get_embeddings(self, list_of_text: List[str]) -> List[List[float]]:
+    def _embed_batch(self, list_of_text: List[str]) -> List[List[float]]:
         embedding_response = self.client.embeddings.create(
             input=list_of_text, model=self.embeddings_model_name
         )
 
         return [embeddings.embedding for embeddings in embedding_response.data]
 
-    def get_embedding(self, text: str) -> List[float]:
-        embedding = self.client.embeddings.create(
-            input=text, model=self.embeddings_model_name
-        )
+    async def async_get_embeddings(self, list_of_text: List[str]) -> List[List[float]]:
+        if self.cache is None:
+            return await self._async_create(list_of_text)
+        # The cache's SQLite tier is read and written in a worker thread
+        cached = await self.cache.aget_many(self.embeddings_model_name, list_of_text)
+        missing = self._misses(list_of_text, cached)
+        fetched = await self._async_create(missing) if missing else []
+        await self.cache.aput_many(self.embeddings_model_name, list(zip(missing, fetched)))
+        return self._merge_fetched(list_of_text, cached, missing, fetched)
+
+    async def _async_embed_query_batch(self, list_of_text: List[str]) -> List[List[float]]:
+        if self.hedger is None:
+            return await self._async_embed_batch(list_of_text)
+        return await self.hedger.call(lambda: self._async_embed_batch(list_of_text))
 
-        return embedding.data[0].embedding
+    async def _async_fetch(self, list_of_text: List[str]) -> List[List[float]]:
+        # Query-time misses (one text, or a coalesced batch of unique texts):
+        # hedged, bounded by the query deadline and cached once fetched
+        request = self.batcher.run(list_of_text, self._async_embed_query_batch)
+        if self.query_timeout_s is None:
+            vectors = await request
+        else:
+            vectors = await asyncio.wait_for(request, self.query_timeout_s)
+        if self.cache is not None:
+            await self.cache.aput_many(self.embeddings_model_name, list(zip(list_of_text, vectors)))
+        return vectors
+
+    async def async_get_embedding(self, text: str) -> List[float]:
+        if self.cache is not None:
+            cached = (await self.cache.aget_many(self.embeddings_model_name, [text]))[0]
+            if cached is not None:
+                return cached
+        if self.coalescer is not None:
+            return await self.coalescer.embed(text)
+        return (await self._async_fetch([text]))[0]
+
+    def get_embeddings(self, list_of_text: List[str]) -> List[List[float]]:
+        if self.cache is None:
+            return self._create(list_of_text)
+        cached = self.cache.get_many(self.embeddings_model_name, list_of_text)
+        missing = self._misses(list_of_text, cached)
+        fetched = self._create(missing) if missing else []
+        self.cache.put_many(self.embeddings_model_name, list(zip(missing, fetched)))
+        return self._merge_fetched(list_of_text, cached, missing, fetched)
+
+    def get_embedding(self, text: str) -> List[float]:
+        return self.get_embeddings([text])[0]
 
 
 if __name__ == "__main__":
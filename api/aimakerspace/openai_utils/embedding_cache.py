@@ -0,0 +1,185 @@
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import sqlite3
+import threading
+
+
+def cache_key(model_name: str, text: str) -> str:
+    """Content address of an embedding: sha256 over the model name and text."""
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Two-tier cache of embeddings keyed by (model name, text hash).
+
+    The memory tier is an LRU bounded by ``max_bytes`` of packed float32
+    vectors. The optional disk tier is a SQLite file that survives restarts
+    and can be shared by several processes; disk hits are promoted into
+    memory. The async methods read the memory tier inline and run SQLite in
+    a worker thread, which takes its own lock, so a slow disk never holds
+    up the event loop.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, path: Optional[str] = None):
+        """
+        :param max_bytes: Memory budget for cached vectors (~6 KB per
+            1536-dim embedding).
+        :param path: SQLite file for the persistent tier, or ``None`` for a
+            memory-only cache.
+        """
+        self.max_bytes = max_bytes
+        self.path = path
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()  # memory tier and counters
+        self._db_lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._db.commit()
+
+    def _remember(self, key: str, packed: bytes) -> None:
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        if len(packed) > self.max_bytes:
+            return
+        self._memory[key] = packed
+        self._memory_bytes += len(packed)
+        while self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _from_memory(self, keys: List[str]) -> Dict[str, bytes]:
+        found: Dict[str, bytes] = {}
+        with self._lock:
+            for key in keys:
+                packed = self._memory.get(key)
+                if packed is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = packed
+        return found
+
+    def _from_disk(self, keys: List[str]) -> Dict[str, bytes]:
+        found: Dict[str, bytes] = {}
+        with self._db_lock:
+            if self._db is None:
+                return found
+            for start in range(0, len(keys), 500):
+                batch = keys[start : start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                found.update(rows)
+        with self._lock:
+            for key, packed in found.items():
+                self._remember(key, packed)
+            self.disk_hits += len(found)
+        return found
+
+    def _to_disk(self, packed_items: List[Tuple[str, bytes]]) -> None:
+        with self._db_lock:
+            if self._db is None:
+                return
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                packed_items,
+            )
+            self._db.commit()
+
+    def _results(self, keys: List[str], found: Dict[str, bytes]) -> List[Optional[List[float]]]:
+        results = []
+        with self._lock:
+            for key in keys:
+                packed = found.get(key)
+                if packed is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    results.append(array("f", packed).tolist())
+        return results
+
+    def _pending(self, keys: List[str], found: Dict[str, bytes]) -> List[str]:
+        if self._db is None:
+            return []
+        return [key for key in dict.fromkeys(keys) if key not in found]
+
+    def get_many(self, model_name: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Cached vectors for ``texts`` in order, ``None`` where missing."""
+        keys = [cache_key(model_name, text) for text in texts]
+        found = self._from_memory(keys)
+        pending = self._pending(keys, found)
+        if pending:
+            found.update(self._from_disk(pending))
+        return self._results(keys, found)
+
+    async def aget_many(self, model_name: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """:meth:`get_many` with the disk tier read in a worker thread."""
+        keys = [cache_key(model_name, text) for text in texts]
+        found = self._from_memory(keys)
+        pending = self._pending(keys, found)
+        if pending:
+            found.update(await asyncio.to_thread(self._from_disk, pending))
+        return self._results(keys, found)
+
+    def _pack(self, model_name: str, items: List[Tuple[str, List[float]]]) -> List[Tuple[str, bytes]]:
+        packed_items = [
+            (cache_key(model_name, text), array("f", vector).tobytes())
+            for text, vector in items
+        ]
+        with self._lock:
+            for key, packed in packed_items:
+                self._remember(key, packed)
+        return packed_items
+
+    def put_many(self, model_name: str, items: List[Tuple[str, List[float]]]) -> None:
+        """Stores ``(text, vector)`` pairs in both tiers."""
+        packed_items = self._pack(model_name, items)
+        if self._db is not None and packed_items:
+            self._to_disk(packed_items)
+
+    async def aput_many(self, model_name: str, items: List[Tuple[str, List[float]]]) -> None:
+        """:meth:`put_many` with the disk tier written in a worker thread."""
+        packed_items = self._pack(model_name, items)
+        if self._db is not None and packed_items:
+            await asyncio.to_thread(self._to_disk, packed_items)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+        }
+
+    def clear(self) -> None:
+        """Drops every cached vector (both tiers) and resets the counters."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            self.hits = self.disk_hits = self.misses = 0
+        with self._db_lock:
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+
+    def close(self) -> None:
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
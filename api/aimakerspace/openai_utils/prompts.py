@@ -1,15 +1,31 @@
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Sequence
 import re
 
+_PLACEHOLDER = re.compile(r"\{([^}]+)\}")
+
 
 class BasePrompt:
     def __init__(self, prompt):
         """
         Initializes the BasePrompt object with a prompt template.
 
+        The template is parsed once, when it is set: formatting only looks
+        up the placeholders found then.
+
         :param prompt: A string that can contain placeholders within curly braces
         """
         self.prompt = prompt
-        self._pattern = re.compile(r"\{([^}]+)\}")
+
+    @property
+    def prompt(self) -> str:
+        return self._prompt
+
+    @prompt.setter
+    def prompt(self, prompt: str) -> None:
+        self._prompt = prompt
+        self._variables = _PLACEHOLDER.findall(prompt)
+        self._names = list(dict.fromkeys(self._variables))
 
     def format_prompt(self, **kwargs):
         """
@@ -18,8 +34,9 @@ class BasePrompt:
         :param kwargs: The values to substitute into the prompt string
         :return: The formatted prompt string
         """
-        matches = self._pattern.findall(self.prompt)
-        return self.prompt.format(**{match: kwargs.get(match, "") for match in matches})
+        if not self._names:
+            return self._prompt
+        return self._prompt.format(**{name: kwargs.get(name, "") for name in self._names})
 
     def get_input_variables(self):
         """
@@ -27,7 +44,7 @@ class BasePrompt:
 
         :return: List of input variable names
         """
-        return self._pattern.findall(self.prompt)
+        return list(self._variables)
 
 
 class RolePrompt(BasePrompt):
@@ -69,6 +86,109 @@ class AssistantRolePrompt(RolePrompt):
         super().__init__(prompt, "assistant")
 
 
+class ContextChunk(NamedTuple):
+    """A retrieved chunk. ``chunk_index`` and the ``start``/``end``
+    character offsets place it in its ``source`` (e.g. one PDF version);
+    chunks without them are never merged."""
+
+    text: str
+    source: Optional[str] = None
+    chunk_index: Optional[int] = None
+    start: Optional[int] = None
+    end: Optional[int] = None
+
+
+class PackedContext(NamedTuple):
+    text: str
+    tokens: int
+    chunks: int  # retrieved chunks included, merged or not
+    passages: int  # separate passages after merging
+
+
+@lru_cache(maxsize=4096)
+def _cached_count(text: str, model_name: str, tokenizer: str) -> int:
+    # The same popular chunks are packed over and over. ``tokenizer`` is only
+    # part of the key, so estimates made before the encoding loaded expire
+    from aimakerspace.openai_utils.tokenizer import count_tokens
+
+    return count_tokens(text, model_name)
+
+
+def _merge_runs(chunks: Sequence[ContextChunk]) -> List[List[int]]:
+    """Positions in ``chunks`` grouped into runs of overlapping or touching
+    chunks of one source, each run in ``chunk_index`` order."""
+    placed = sorted(
+        (i for i, chunk in enumerate(chunks) if None not in (chunk.chunk_index, chunk.start, chunk.end)),
+        key=lambda i: (chunks[i].source or "", chunks[i].chunk_index),
+    )
+    runs: List[List[int]] = []
+    run_end = 0
+    for i in placed:
+        chunk = chunks[i]
+        if runs and chunk.source == chunks[runs[-1][0]].source and chunk.start <= run_end:
+            runs[-1].append(i)
+            run_end = max(run_end, chunk.end)
+        else:
+            runs.append([i])
+            run_end = chunk.end
+    placed_set = set(placed)
+    runs.extend([i] for i in range(len(chunks)) if i not in placed_set)
+    return runs
+
+
+def _run_text(chunks: Sequence[ContextChunk], run: List[int]) -> str:
+    if len(run) == 1:
+        return chunks[run[0]].text
+    text = chunks[run[0]].text
+    end = chunks[run[0]].end
+    for i in run[1:]:
+        chunk = chunks[i]
+        if chunk.end <= end:  # repeated or contained chunk
+            continue
+        text += chunk.text[end - chunk.start:]
+        end = chunk.end
+    return text
+
+
+def pack_context(
+    chunks: Sequence[ContextChunk],
+    max_tokens: int,
+    model_name: str = "gpt-4o-mini",
+    separator: str = "\n---\n",
+) -> PackedContext:
+    """Joins retrieved ``chunks`` (best first) into at most ``max_tokens``.
+
+    Overlapping or adjacent chunks of the same source are merged into one
+    passage, so the overlap between neighbouring chunks is sent once.
+    Passages are added in order of their best chunk while they fit; one that
+    does not fit is skipped for a smaller one. If even the best passage is
+    over budget, it is cut at a token boundary.
+    """
+    from aimakerspace.openai_utils.tokenizer import tokenizer_name
+
+    tokenizer = tokenizer_name(model_name)
+    runs = sorted(_merge_runs(chunks), key=min)
+    separator_tokens = _cached_count(separator, model_name, tokenizer) if separator else 0
+    passages: List[str] = []
+    tokens = used = 0
+    for run in runs:
+        text = _run_text(chunks, run)
+        cost = _cached_count(text, model_name, tokenizer) + (separator_tokens if passages else 0)
+        if tokens + cost > max_tokens:
+            if passages:
+                continue
+            from aimakerspace.openai_utils.tokenizer import token_offsets
+
+            offsets = token_offsets(text, model_name)
+            if len(offsets) > max_tokens:
+                text = text[: offsets[max_tokens]]
+            cost = min(cost, max_tokens)
+        passages.append(text)
+        tokens += cost
+        used += len(run)
+    return PackedContext(separator.join(passages), tokens, used, len(passages))
+
+
 if __name__ == "__main__":
     prompt = BasePrompt("Hello {name}, you are {age} years old")
     print(prompt.format_prompt(name="John", age=30))
@@ -0,0 +1,130 @@
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+import asyncio
+import math
+import random
+import time
+
+import openai
+
+T = TypeVar("T")
+
+# Errors worth retrying: throttling, transport failures, 5xx responses and
+# our own per-attempt deadlines running out
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+
+class RetryPolicy:
+    """Jittered exponential backoff for retryable API errors.
+
+    Retry ``n`` (from 0) waits ``backoff_base * 2**n`` plus up to
+    ``backoff_base`` of random jitter, at most ``max_delay`` seconds, so
+    callers that failed together do not retry together.
+    """
+
+    def __init__(self, max_retries: int = 3, backoff_base: float = 0.5, max_delay: float = 8.0):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        return min(self.max_delay, self.backoff_base * 2**attempt + random.uniform(0, self.backoff_base))
+
+    async def call(self, fn: Callable[[], Awaitable[T]], attempt_timeout: Optional[float] = None) -> T:
+        """Awaits ``fn()``, retrying retryable errors; each attempt is
+        limited to ``attempt_timeout`` seconds if given."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                if attempt_timeout is None:
+                    return await fn()
+                return await asyncio.wait_for(fn(), attempt_timeout)
+            except RETRYABLE_ERRORS:
+                if attempt == self.max_retries:
+                    raise
+            await asyncio.sleep(self.delay(attempt))
+
+    def call_sync(self, fn: Callable[[], T]) -> T:
+        """Blocking counterpart of :meth:`call`."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return fn()
+            except RETRYABLE_ERRORS:
+                if attempt == self.max_retries:
+                    raise
+            time.sleep(self.delay(attempt))
+
+
+class Hedger:
+    """Sends a duplicate of a slow call and takes whichever answers first.
+
+    A call still pending after the ``quantile`` of recent successful call
+    latencies (at least ``min_delay_s``) gets one backup copy; the loser is
+    cancelled. Until ``min_samples`` latencies are known ``min_delay_s`` is
+    used. Only idempotent calls, such as embedding requests, may be hedged.
+    """
+
+    def __init__(
+        self,
+        quantile: float = 0.95,
+        min_delay_s: float = 0.1,
+        min_samples: int = 20,
+        window: int = 256,
+    ):
+        self.quantile = quantile
+        self.min_delay_s = min_delay_s
+        self.min_samples = min_samples
+        self._latencies: deque = deque(maxlen=window)
+        self.calls = 0
+        self.hedged = 0
+        self.backup_wins = 0
+
+    def delay(self) -> float:
+        if len(self._latencies) < self.min_samples:
+            return self.min_delay_s
+        latencies = sorted(self._latencies)
+        index = min(len(latencies) - 1, math.ceil(self.quantile * len(latencies)) - 1)
+        return max(self.min_delay_s, latencies[index])
+
+    async def _timed(self, fn: Callable[[], Awaitable[T]]) -> T:
+        start = time.perf_counter()
+        result = await fn()
+        self._latencies.append(time.perf_counter() - start)
+        return result
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        self.calls += 1
+        primary = asyncio.ensure_future(self._timed(fn))
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.delay())
+            if done:
+                return primary.result()
+            self.hedged += 1
+            backup = asyncio.ensure_future(self._timed(fn))
+            pending.add(backup)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.backup_wins += task is backup
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "backup_wins": self.backup_wins,
+            "delay_s": round(self.delay(), 4),
+        }
@@ -0,0 +1,92 @@
+from typing import Dict, List
+import asyncio
+import threading
+import time
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional; fall back to a length estimate
+    tiktoken = None
+
+# Rough characters-per-token ratio of OpenAI tokenizers on English text
+CHARS_PER_TOKEN = 4
+
+# Seconds before loading an encoding that failed to load is tried again
+RETRY_LOAD_S = 60.0
+
+_encodings: Dict[str, object] = {}  # model name -> loaded encoding
+_failed_at: Dict[str, float] = {}  # model name -> time of the last failed load
+_load_lock = threading.Lock()
+
+
+def _load(model_name: str):
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        pass  # unknown model: fall back to the common encoding below
+    except Exception:
+        # Encodings are downloaded on first use and may be unreachable offline
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def get_encoding(model_name: str):
+    """The tiktoken encoding for ``model_name``, or ``None`` if unavailable.
+
+    The first call per model may download and parse the BPE file, so async
+    code should use :func:`aget_encoding`. Only loaded encodings are kept;
+    after a failure the load is retried once ``RETRY_LOAD_S`` has passed.
+    """
+    encoding = _encodings.get(model_name)
+    if encoding is not None or tiktoken is None:
+        return encoding
+    failed_at = _failed_at.get(model_name)
+    if failed_at is not None and time.monotonic() - failed_at < RETRY_LOAD_S:
+        return None
+    with _load_lock:
+        if model_name not in _encodings:
+            encoding = _load(model_name)
+            if encoding is None:
+                _failed_at[model_name] = time.monotonic()
+                return None
+            _encodings[model_name] = encoding
+            _failed_at.pop(model_name, None)
+    return _encodings[model_name]
+
+
+async def aget_encoding(model_name: str):
+    """:func:`get_encoding` that loads the encoding in a worker thread, so
+    the event loop never waits for a download."""
+    if model_name in _encodings:
+        return _encodings[model_name]
+    return await asyncio.to_thread(get_encoding, model_name)
+
+
+def tokenizer_name(model_name: str) -> str:
+    """What :func:`count_tokens` and :func:`token_offsets` currently use for
+    ``model_name``: the encoding's name, or the length estimate."""
+    encoding = get_encoding(model_name)
+    return f"chars/{CHARS_PER_TOKEN}" if encoding is None else encoding.name
+
+
+def count_tokens(text: str, model_name: str = "text-embedding-3-small") -> int:
+    """Number of tokens in ``text``; estimated from its length without tiktoken."""
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def token_offsets(text: str, model_name: str = "text-embedding-3-small") -> List[int]:
+    """Character offset at which each token of ``text`` starts.
+
+    Without tiktoken every ``CHARS_PER_TOKEN`` characters count as a token.
+    """
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return list(range(0, len(text), CHARS_PER_TOKEN))
+    _, offsets = encoding.decode_with_offsets(encoding.encode(text, disallowed_special=()))
+    return offsets
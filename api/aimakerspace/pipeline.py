@@ -0,0 +1,112 @@
+from itertools import islice
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, Iterable, List
+import asyncio
+import time
+
+if TYPE_CHECKING:
+    from aimakerspace.openai_utils.embedding import EmbeddingModel
+
+# Called with (index of the first chunk, chunks, their embeddings)
+Sink = Callable[[int, List[str], List[List[float]]], Awaitable[None]]
+
+_DONE = object()
+
+
+class StageStats:
+    """Items processed and busy time (excluding queue waits) of one stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.batches = 0
+        self.busy_s = 0.0
+
+    def record(self, items: int, seconds: float) -> None:
+        self.items += items
+        self.batches += 1 if items else 0
+        self.busy_s += seconds
+
+    def as_dict(self) -> dict:
+        return {
+            "items": self.items,
+            "batches": self.batches,
+            "busy_s": round(self.busy_s, 4),
+            "items_per_s": round(self.items / self.busy_s, 2) if self.busy_s else None,
+        }
+
+
+class IngestionPipeline:
+    """Streams chunks -> embedding batches -> sink with overlapping stages.
+
+    Three tasks are connected by queues of at most ``queue_size`` batches:
+    pulling ``batch_size`` chunks from the (blocking) chunk iterator in a
+    worker thread, embedding a batch, and handing it to ``sink`` (e.g. an
+    upsert). Peak memory is therefore a few batches, whatever the document
+    size. A failure in any stage cancels the others and is re-raised.
+    """
+
+    def __init__(
+        self,
+        embedding_model: "EmbeddingModel",
+        batch_size: int = 64,
+        queue_size: int = 2,
+    ):
+        self.embedding_model = embedding_model
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+
+    async def run(self, chunks: Iterable[str], sink: Sink) -> Dict[str, dict]:
+        """Feeds every chunk through the pipeline; returns per-stage stats."""
+        stats = {name: StageStats(name) for name in ("chunk", "embed", "sink")}
+        chunk_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        vector_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        iterator = iter(chunks)
+
+        def next_batch() -> List[str]:
+            return list(islice(iterator, self.batch_size))
+
+        async def produce():
+            start = 0
+            while True:
+                began = time.perf_counter()
+                batch = await asyncio.to_thread(next_batch)
+                stats["chunk"].record(len(batch), time.perf_counter() - began)
+                if not batch:
+                    break
+                await chunk_queue.put((start, batch))
+                start += len(batch)
+            await chunk_queue.put(_DONE)
+
+        async def embed():
+            while (item := await chunk_queue.get()) is not _DONE:
+                start, batch = item
+                began = time.perf_counter()
+                vectors = await self.embedding_model.async_get_embeddings(batch)
+                stats["embed"].record(len(batch), time.perf_counter() - began)
+                await vector_queue.put((start, batch, vectors))
+            await vector_queue.put(_DONE)
+
+        async def consume():
+            while (item := await vector_queue.get()) is not _DONE:
+                start, batch, vectors = item
+                began = time.perf_counter()
+                await sink(start, batch, vectors)
+                stats["sink"].record(len(batch), time.perf_counter() - began)
+
+        began = time.perf_counter()
+        tasks = [asyncio.create_task(stage()) for stage in (produce, embed, consume)]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+        result = {name: stage.as_dict() for name, stage in stats.items()}
+        result["total"] = {
+            "items": stats["sink"].items,
+            "wall_s": round(time.perf_counter() - began, 4),
+        }
+        return result
@@ -0,0 +1,136 @@
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional
+import itertools
+import time
+
+import numpy as np
+
+from aimakerspace.vectordatabase import VectorDatabase
+
+
+class _Entry:
+    __slots__ = ("key", "partition", "value", "created_at")
+
+    def __init__(self, key: str, partition: Hashable, value, created_at: float):
+        self.key = key
+        self.partition = partition
+        self.value = value
+        self.created_at = created_at
+
+
+class SemanticCache:
+    """Caches values (e.g. LLM answers) under question embeddings.
+
+    A lookup hits when a cached question in the same partition (e.g. one
+    PDF and model) has cosine similarity of at least ``threshold`` with the
+    query. Each partition is a ``"matrix"`` :class:`VectorDatabase`, so a
+    lookup is one matrix-vector product. Entries expire ``ttl_s`` seconds
+    after being stored, and the least recently used entry overall is
+    evicted beyond ``max_entries``.
+    """
+
+    def __init__(
+        self,
+        embedding_model=None,
+        threshold: float = 0.95,
+        ttl_s: float = 3600.0,
+        max_entries: int = 1000,
+    ):
+        self.embedding_model = embedding_model
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._partitions: Dict[Hashable, VectorDatabase] = {}
+        self._live: Dict[Hashable, int] = {}
+        # Evicted entries still have rows in their partition until it is rebuilt
+        self._dead: Dict[Hashable, int] = {}
+        self._ids = itertools.count()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return now - entry.created_at > self.ttl_s
+
+    def _drop(self, key: str) -> None:
+        partition = self._entries.pop(key).partition
+        self._live[partition] -= 1
+        self._dead[partition] += 1
+        if not self._live[partition]:
+            self._forget(partition)
+        elif self._dead[partition] > max(self._live[partition], 32):
+            self._rebuild(partition)
+
+    def _forget(self, partition: Hashable) -> None:
+        del self._partitions[partition]
+        del self._live[partition]
+        del self._dead[partition]
+
+    def _rebuild(self, partition: Hashable) -> None:
+        old = self._partitions[partition]
+        db = VectorDatabase(embedding_model=self.embedding_model, storage="matrix")
+        for key, entry in self._entries.items():
+            if entry.partition == partition:
+                db.insert(key, old.retrieve_from_key(key))
+        self._partitions[partition] = db
+        self._dead[partition] = 0
+
+    def get(self, partition: Hashable, query_vector) -> Optional[object]:
+        """The value cached for the closest question within ``threshold``."""
+        db = self._partitions.get(partition)
+        if db is not None:
+            now = time.time()
+            # Look past rows of evicted entries that may outrank live ones
+            for key, score in db.search(np.asarray(query_vector), self._dead.get(partition, 0) + 1):
+                if score < self.threshold:
+                    break
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if self._expired(entry, now):
+                    self._drop(key)
+                    continue
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.value
+        self.misses += 1
+        return None
+
+    def put(self, partition: Hashable, query_vector, value) -> None:
+        key = str(next(self._ids))
+        db = self._partitions.get(partition)
+        if db is None:
+            db = self._partitions[partition] = VectorDatabase(
+                embedding_model=self.embedding_model, storage="matrix"
+            )
+            self._live[partition] = self._dead[partition] = 0
+        db.insert(key, np.asarray(query_vector))
+        self._entries[key] = _Entry(key, partition, value, time.time())
+        self._live[partition] += 1
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def invalidate(self, predicate) -> int:
+        """Drops every partition for which ``predicate(partition)`` is true."""
+        partitions = [partition for partition in self._partitions if predicate(partition)]
+        keys: List[str] = [
+            key for key, entry in self._entries.items() if entry.partition in partitions
+        ]
+        for key in keys:
+            del self._entries[key]
+        for partition in partitions:
+            self._forget(partition)
+        return len(keys)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "partitions": len(self._partitions),
+        }
@@ -0,0 +1,154 @@
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+import sqlite3
+import string
+import threading
+
+from aimakerspace.stopwords import ENGLISH_STOPWORDS
+
+_PUNCTUATION = str.maketrans("", "", string.punctuation)
+
+
+def count_terms(text: str) -> Counter:
+    """Word counts of ``text``: lowercased, punctuation stripped, stopwords
+    (bundled copy of NLTK's English list) and words under 3 letters dropped."""
+    words = text.lower().translate(_PUNCTUATION).split()
+    return Counter(w for w in words if w not in ENGLISH_STOPWORDS and len(w) > 2)
+
+
+class TermStats:
+    """Per-document term frequencies with a running corpus-wide total.
+
+    Each document's counts are stored once, when it is indexed. The corpus
+    table is updated by adding a document's counts and subtracting those of
+    the version it replaces, so corpus-wide top terms are one indexed query
+    however many documents there are. Backed by SQLite; ``path=None`` keeps
+    everything in memory.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        if path is not None:
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                filename TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                total INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS document_terms (
+                filename TEXT NOT NULL,
+                term TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (filename, term)
+            );
+            CREATE INDEX IF NOT EXISTS document_terms_by_count
+                ON document_terms (filename, count DESC);
+            CREATE TABLE IF NOT EXISTS corpus_terms (
+                term TEXT PRIMARY KEY,
+                count INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS corpus_terms_by_count ON corpus_terms (count DESC);
+            """
+        )
+        self._db.commit()
+
+    def _subtract(self, filename: str) -> None:
+        # Takes a stored document's counts out of the corpus totals
+        self._db.execute(
+            """
+            UPDATE corpus_terms SET count = count - (
+                SELECT d.count FROM document_terms d
+                WHERE d.filename = ? AND d.term = corpus_terms.term
+            )
+            WHERE term IN (SELECT term FROM document_terms WHERE filename = ?)
+            """,
+            (filename, filename),
+        )
+        self._db.execute("DELETE FROM corpus_terms WHERE count <= 0")
+        self._db.execute("DELETE FROM document_terms WHERE filename = ?", (filename,))
+        self._db.execute("DELETE FROM documents WHERE filename = ?", (filename,))
+
+    def put(self, filename: str, content_hash: str, counts: Dict[str, int]) -> None:
+        """Stores a document's term counts, replacing any previous version."""
+        rows = [(filename, term, count) for term, count in counts.items()]
+        with self._lock, self._db:
+            self._subtract(filename)
+            self._db.execute(
+                "INSERT INTO documents (filename, content_hash, total) VALUES (?, ?, ?)",
+                (filename, content_hash, sum(counts.values())),
+            )
+            self._db.executemany(
+                "INSERT INTO document_terms (filename, term, count) VALUES (?, ?, ?)", rows
+            )
+            self._db.executemany(
+                """
+                INSERT INTO corpus_terms (term, count) VALUES (?, ?)
+                ON CONFLICT (term) DO UPDATE SET count = count + excluded.count
+                """,
+                [(term, count) for _, term, count in rows],
+            )
+
+    def remove(self, filename: str) -> None:
+        with self._lock, self._db:
+            self._subtract(filename)
+
+    def retain(self, versions: Iterable[Tuple[str, str]], skip: Iterable[str] = ()) -> List[str]:
+        """Drops the counts of every document whose stored version is not
+        among ``(filename, content_hash)`` ``versions``, except documents
+        named in ``skip``; returns the names dropped."""
+        keep = set(versions)
+        skip = set(skip)
+        with self._lock, self._db:
+            stale = [
+                filename
+                for filename, content_hash in self._db.execute("SELECT filename, content_hash FROM documents").fetchall()
+                if (filename, content_hash) not in keep and filename not in skip
+            ]
+            for filename in stale:
+                self._subtract(filename)
+        return stale
+
+    def content_hash(self, filename: str) -> Optional[str]:
+        """Version of the stored counts for ``filename``, if any."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT content_hash FROM documents WHERE filename = ?", (filename,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def top_terms(self, n: int = 20, filename: Optional[str] = None) -> List[Tuple[str, int]]:
+        """The ``n`` most frequent terms of one document, or of the corpus."""
+        with self._lock:
+            if filename is None:
+                cursor = self._db.execute(
+                    "SELECT term, count FROM corpus_terms ORDER BY count DESC, term LIMIT ?",
+                    (n,),
+                )
+            else:
+                cursor = self._db.execute(
+                    """
+                    SELECT term, count FROM document_terms WHERE filename = ?
+                    ORDER BY count DESC, term LIMIT ?
+                    """,
+                    (filename, n),
+                )
+            return cursor.fetchall()
+
+    def documents(self) -> List[dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT filename, content_hash, total FROM documents ORDER BY filename"
+            ).fetchall()
+        return [
+            {"filename": filename, "content_hash": content_hash, "terms": total}
+            for filename, content_hash, total in rows
+        ]
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
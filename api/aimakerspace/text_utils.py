@@ -1,6 +1,7 @@
 import os
-from typing import List
-import PyPDF2
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple, Union
 
 
 class TextFileLoader:
@@ -37,45 +38,237 @@ class TextFileLoader:
         return self.documents
 
 
+# (start, end) character offsets of a chunk in its source text
+Span = Tuple[int, int]
+
+# Sentence ends a chunk is preferably cut after, best first
+SENTENCE_BREAKS = (". ", "? ", "! ", "\n")
+
+# Characters of text tokenized per token of budget; doubled when too few
+WINDOW_CHARS_PER_TOKEN = 8
+
+
 class CharacterTextSplitter:
     def __init__(
         self,
         chunk_size: int = 1000,
         chunk_overlap: int = 200,
+        boundaries: bool = False,
+        unit: str = "chars",
+        model_name: str = "text-embedding-3-small",
     ):
+        """
+        :param chunk_size: Maximum chunk length, in ``unit``.
+        :param chunk_overlap: Length shared by consecutive chunks, in ``unit``.
+        :param boundaries: Cut chunks after the last sentence end (or else
+            the last whitespace) in the second half of the window, and start
+            the overlap (at most half a window) at a word. Whitespace around
+            chunks is trimmed. Off, chunks are fixed-size windows cut anywhere.
+        :param unit: ``"chars"``, or ``"tokens"`` to budget chunks in tokens
+            of ``model_name`` (estimated from length without tiktoken).
+        """
         assert (
             chunk_size > chunk_overlap
         ), "Chunk size must be greater than chunk overlap"
+        assert unit in ("chars", "tokens"), "Unit must be 'chars' or 'tokens'"
 
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.boundaries = boundaries
+        self.unit = unit
+        self.model_name = model_name
+
+    def _snap_end(self, text: str, start: int, limit: int) -> int:
+        # Only look back over the second half of the window so chunks stay
+        # reasonably full; text[limit] exists, so a break may end there
+        low = start + (limit - start) // 2
+        end = max(text.rfind(sep, low, limit + 1) for sep in SENTENCE_BREAKS)
+        if end >= low:
+            return end + 1
+        end = max(text.rfind(" ", low, limit + 1), text.rfind("\t", low, limit + 1))
+        return end if end > low else limit
+
+    def _snap_start(self, text: str, start: int, end: int) -> int:
+        # Move the start of the overlap forward to the beginning of a word
+        if start == 0 or text[start - 1].isspace():
+            return start
+        for i in range(start, end):
+            if text[i].isspace():
+                return i + 1
+        return start
+
+    def _token_window(self, text: str, start: int, final: bool) -> Optional[List[int]]:
+        # Token start offsets (relative to ``start``) of a window holding
+        # more than chunk_size tokens, or all remaining text. Tokenizing from
+        # the chunk start means the result never depends on text before it
+        from aimakerspace.openai_utils.tokenizer import token_offsets
+
+        window = self.chunk_size * WINDOW_CHARS_PER_TOKEN
+        while True:
+            if start + window >= len(text) and not final:
+                return None
+            offsets = token_offsets(text[start : start + window], self.model_name)
+            if len(offsets) > self.chunk_size or start + window >= len(text):
+                return offsets
+            window *= 2
+
+    def _scan(self, text: str, start: int, final: bool) -> Iterator[Tuple[int, int, int]]:
+        """Yields (chunk start, chunk end, next chunk start) from ``start``.
+
+        Unless ``final``, stops before the first chunk whose window runs
+        past the end of ``text``, since more text may still follow.
+        """
+        n = len(text)
+        while start < n:
+            offsets = None
+            if self.unit == "tokens":
+                offsets = self._token_window(text, start, final)
+                if offsets is None:
+                    return
+                limit = start + offsets[self.chunk_size] if len(offsets) > self.chunk_size else n
+            else:
+                limit = start + self.chunk_size
+            if limit >= n and not final:
+                return
+            end = min(limit, n)
+            if self.boundaries and end < n:
+                end = self._snap_end(text, start, end)
+            if not self.boundaries and offsets is None:
+                # Plain fixed-size windows keep stepping to the end of the text
+                next_start = start + self.chunk_size - self.chunk_overlap
+            elif limit >= n:
+                next_start = n
+            else:
+                if offsets is None:
+                    next_start = end - self.chunk_overlap
+                else:
+                    # The token that ``end`` falls in (or starts) is the
+                    # first after the overlap
+                    last = bisect_right(offsets, end - start) - 1
+                    first = max(0, last - self.chunk_overlap)
+                    next_start = start + offsets[first]
+                if self.boundaries:
+                    # Overlap at most half a window, or the next chunk could
+                    # snap back to this same end
+                    next_start = max(next_start, end - (limit - start) // 2)
+                    next_start = self._snap_start(text, next_start, end)
+                next_start = max(next_start, start + 1)
+            chunk_start, chunk_end = start, end
+            if self.boundaries:
+                while chunk_start < chunk_end and text[chunk_start].isspace():
+                    chunk_start += 1
+                while chunk_end > chunk_start and text[chunk_end - 1].isspace():
+                    chunk_end -= 1
+            if chunk_start < chunk_end:
+                yield chunk_start, chunk_end, next_start
+            start = next_start
+
+    def split_spans(self, text: str) -> Iterator[Span]:
+        """Lazily yields the (start, end) offsets of the chunks of ``text``.
+
+        Cheaper than :meth:`split` when the caller already holds the text:
+        overlapping chunks are never copied out of it.
+        """
+        for start, end, _ in self._scan(text, 0, final=True):
+            yield start, end
 
     def split(self, text: str) -> List[str]:
-        chunks = []
-        for i in range(0, len(text), self.chunk_size - self.chunk_overlap):
-            chunks.append(text[i : i + self.chunk_size])
-        return chunks
+        return [text[start:end] for start, end in self.split_spans(text)]
 
-    def split_texts(self, texts: List[str]) -> List[str]:
-        chunks = []
+    def split_texts(self, texts: Iterable[str]) -> Iterator[str]:
+        """Lazily yields the chunks of each text in turn."""
         for text in texts:
-            chunks.extend(self.split(text))
-        return chunks
+            yield from (text[start:end] for start, end in self.split_spans(text))
+
+    def split_stream_spans(self, pieces: Iterable[str]) -> Iterator[Tuple[int, int, str]]:
+        """Lazily yields (start, end, chunk) for ``"".join(pieces)``.
+
+        Produces exactly what :meth:`split_spans` and :meth:`split` would on
+        the joined text, but only buffers about one chunk plus the current
+        piece (e.g. one PDF page). Offsets are into the joined text.
+        """
+        buffer = ""
+        base = 0  # offset of buffer[0] in the joined text
+        start = 0
+        for piece in pieces:
+            buffer += piece
+            for chunk_start, chunk_end, start in self._scan(buffer, start, final=False):
+                yield base + chunk_start, base + chunk_end, buffer[chunk_start:chunk_end]
+            if start:
+                buffer = buffer[start:]
+                base += start
+                start = 0
+        for chunk_start, chunk_end, _ in self._scan(buffer, start, final=True):
+            yield base + chunk_start, base + chunk_end, buffer[chunk_start:chunk_end]
+
+    def split_stream(self, pieces: Iterable[str]) -> Iterator[str]:
+        """Lazily yields the chunks of ``"".join(pieces)``; see :meth:`split_stream_spans`."""
+        return (chunk for _, _, chunk in self.split_stream_spans(pieces))
+
+
+def iter_pdf_pages(source: Union[str, BinaryIO]) -> Iterator[str]:
+    """Yields the text of each page of a PDF, followed by a newline.
+
+    ``source`` is a path or a seekable binary file object (e.g. an upload's
+    spooled file), so the PDF never has to be copied to disk first.
+    """
+    import PyPDF2  # imported on first use; it is slow to import
+
+    if isinstance(source, str):
+        with open(source, "rb") as file:
+            yield from iter_pdf_pages(file)
+        return
+    pdf_reader = PyPDF2.PdfReader(source)
+    for page in pdf_reader.pages:
+        yield page.extract_text() + "\n"
+
+
+def count_pdf_pages(source: Union[str, BinaryIO]) -> int:
+    """Page count of a PDF path or seekable binary file object (rewound)."""
+    import PyPDF2
+
+    if isinstance(source, str):
+        with open(source, "rb") as file:
+            return count_pdf_pages(file)
+    source.seek(0)
+    count = len(PyPDF2.PdfReader(source).pages)
+    source.seek(0)
+    return count
+
+
+def _extract_page_range(path: str, start: int, stop: int) -> str:
+    # Runs in a worker process: each task parses the PDF and extracts its pages
+    import PyPDF2
+
+    with open(path, "rb") as file:
+        pages = PyPDF2.PdfReader(file).pages
+        return "".join(pages[i].extract_text() + "\n" for i in range(start, stop))
+
+
+def _extract_file(path: str) -> str:
+    return "".join(iter_pdf_pages(path))
 
 
 class PDFLoader:
-    def __init__(self, path: str):
+    def __init__(self, path: str, workers: int = 1, pages_per_task: Optional[int] = None):
+        """
+        :param path: A PDF file or a directory searched recursively for PDFs.
+        :param workers: Processes used for text extraction. ``1`` extracts
+            serially in this process; ``0`` or ``None`` uses every CPU. A
+            single file is split into page ranges, a directory into files.
+        :param pages_per_task: Pages per worker task when splitting one file
+            (default: enough for ~4 tasks per worker).
+        """
         self.documents = []
         self.path = path
-        print(f"PDFLoader initialized with path: {self.path}")
+        self.workers = workers if workers else os.cpu_count() or 1
+        self.pages_per_task = pages_per_task
 
     def load(self):
-        print(f"Loading PDF from path: {self.path}")
-        print(f"Path exists: {os.path.exists(self.path)}")
-        print(f"Is file: {os.path.isfile(self.path)}")
-        print(f"Is directory: {os.path.isdir(self.path)}")
-        print(f"File permissions: {oct(os.stat(self.path).st_mode)[-3:]}")
-        
+        if os.path.isdir(self.path):
+            self.load_directory()
+            return
+
         try:
             # Try to open the file first to verify access
             with open(self.path, 'rb') as test_file:
@@ -89,32 +282,42 @@ class PDFLoader:
         except Exception as e:
             raise ValueError(f"Error processing file at '{self.path}': {str(e)}")
 
+    def _page_ranges(self, page_count: int) -> List[range]:
+        size = self.pages_per_task or max(1, -(-page_count // (self.workers * 4)))
+        return [range(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
     def load_file(self):
-        with open(self.path, 'rb') as file:
-            # Create PDF reader object
-            pdf_reader = PyPDF2.PdfReader(file)
-            
-            # Extract text from each page
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            
-            self.documents.append(text)
+        if self.workers <= 1:
+            # Join once instead of growing a string page by page
+            self.documents.append("".join(iter_pdf_pages(self.path)))
+            return
+        ranges = self._page_ranges(count_pdf_pages(self.path))
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(ranges) or 1)) as executor:
+            parts = executor.map(
+                _extract_page_range,
+                [self.path] * len(ranges),
+                [r.start for r in ranges],
+                [r.stop for r in ranges],
+            )
+            self.documents.append("".join(parts))
 
     def load_directory(self):
-        for root, _, files in os.walk(self.path):
-            for file in files:
-                if file.lower().endswith('.pdf'):
-                    file_path = os.path.join(root, file)
-                    with open(file_path, 'rb') as f:
-                        pdf_reader = PyPDF2.PdfReader(f)
-                        
-                        # Extract text from each page
-                        text = ""
-                        for page in pdf_reader.pages:
-                            text += page.extract_text() + "\n"
-                        
-                        self.documents.append(text)
+        file_paths = [
+            os.path.join(root, file)
+            for root, _, files in os.walk(self.path)
+            for file in files
+            if file.lower().endswith('.pdf')
+        ]
+        if self.workers <= 1 or len(file_paths) <= 1:
+            self.documents.extend(_extract_file(file_path) for file_path in file_paths)
+            return
+        # executor.map yields in submission order, so documents keep walk order
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(file_paths))) as executor:
+            self.documents.extend(executor.map(_extract_file, file_paths))
+
+    def iter_pages(self) -> Iterator[str]:
+        """Yields page texts of the PDF at ``path`` without building the document."""
+        return iter_pdf_pages(self.path)
 
     def load_documents(self):
         self.load()
@@ -125,7 +328,7 @@ if __name__ == "__main__":
     loader = TextFileLoader("data/KingLear.txt")
     loader.load()
     splitter = CharacterTextSplitter()
-    chunks = splitter.split_texts(loader.documents)
+    chunks = list(splitter.split_texts(loader.documents))
     print(len(chunks))
     print(chunks[0])
     print("--------")
@@ -0,0 +1,24 @@
+import numpy as np
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalizes a vector (or each row of a matrix) as float32."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Returns the indices of the ``k`` highest scores, best first.
+
+    Uses ``argpartition`` so only the selected ``k`` entries are sorted.
+    """
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.shape[0]:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.shape[0])
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
@@ -1,7 +1,13 @@
 import numpy as np
 from collections import defaultdict
-from typing import List, Tuple, Callable
+import json
+import os
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple, Callable
 from aimakerspace.openai_utils.embedding import EmbeddingModel
+from aimakerspace.vector_math import normalize, top_k_indices
+from aimakerspace.matrix_store import MatrixStore, STORAGE_DTYPES
+from aimakerspace.ann import IVFIndex
+from aimakerspace.lexical import BM25Index, reciprocal_rank_fusion
 import asyncio
 
 
@@ -13,40 +19,499 @@ def cosine_similarity(vector_a: np.array, vector_b: np.array) -> float:
     return dot_product / (norm_a * norm_b)
 
 
+class ScoredPoint(NamedTuple):
+    """A search hit with its payload, shaped like Qdrant's ``ScoredPoint``."""
+
+    id: str
+    score: float
+    payload: Optional[dict]
+
+
+def _write_array(path: str, array: Optional[np.ndarray]) -> None:
+    """Writes ``array`` as raw bytes via a temporary file, or removes ``path``."""
+    if array is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    np.ascontiguousarray(array).tofile(path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def _open_array(path: str, dtype, shape, mmap_mode: Optional[str]) -> Optional[np.ndarray]:
+    if not os.path.exists(path):
+        return None
+    if mmap_mode is None:
+        return np.fromfile(path, dtype=dtype).reshape(shape)
+    return np.memmap(path, dtype=dtype, mode=mmap_mode, shape=shape)
+
+
 class VectorDatabase:
-    def __init__(self, embedding_model: EmbeddingModel = None):
+    def __init__(
+        self,
+        embedding_model: EmbeddingModel = None,
+        storage: str = "dict",
+        initial_capacity: int = 1024,
+        index: Optional[IVFIndex] = None,
+        dtype: str = "float32",
+        rescore: int = 0,
+        lexical: Optional[BM25Index] = None,
+    ):
+        """
+        :param storage: ``"dict"`` keeps the original key -> vector map and
+            scores with ``distance_measure`` one vector at a time.
+            ``"matrix"`` keeps pre-normalized rows in a :class:`MatrixStore`
+            and scores with a single matrix product.
+        :param initial_capacity: Starting row capacity for ``"matrix"`` storage.
+        :param index: Optional approximate nearest-neighbour index used by
+            cosine searches once it is trained. Implies ``"matrix"`` storage.
+        :param dtype: Resident vector type for ``"matrix"`` storage:
+            ``"float32"``, ``"float16"`` or ``"int8"``. Anything but float32
+            implies ``"matrix"`` storage.
+        :param rescore: If positive, this many top candidates from the
+            quantized scan are re-scored against a float32 copy of each
+            vector before the final top ``k`` is taken. The copy is kept
+            on disk and memory-mapped, so it costs no resident memory
+            beyond the rows being re-scored.
+        :param lexical: Optional BM25 index, fed the text of every insert.
+            Enables ``prefilter`` in :meth:`search` and
+            :meth:`hybrid_search_by_text`.
+
+        Inserts may carry a payload dict. Searches take a ``query_filter``
+        mapping payload fields to a required value (or a list of allowed
+        values); fields passed to :meth:`create_payload_index` are served
+        from per-value partitions, so a filtered search only scores the
+        matching rows.
+        """
+        if storage not in ("dict", "matrix"):
+            raise ValueError("storage must be 'dict' or 'matrix'")
+        if index is not None or dtype != "float32":
+            storage = "matrix"
+        self.storage = storage
+        self.rescore = rescore
         self.vectors = defaultdict(np.array)
+        self.store = (
+            MatrixStore(initial_capacity, dtype=dtype, keep_exact=rescore > 0)
+            if storage == "matrix"
+            else None
+        )
+        self.index = index
+        self.lexical = lexical
+        self.payloads: Dict[str, dict] = {}
+        # field -> value -> keys whose payload has that value
+        self.payload_indexes: Dict[str, Dict[Any, Set[str]]] = {}
         self.embedding_model = embedding_model or EmbeddingModel()
 
-    def insert(self, key: str, vector: np.array) -> None:
-        self.vectors[key] = vector
+    def __len__(self) -> int:
+        return len(self.store) if self.store is not None else len(self.vectors)
+
+    def insert(
+        self,
+        key: str,
+        vector: np.array,
+        text: Optional[str] = None,
+        payload: Optional[dict] = None,
+    ) -> None:
+        """Stores ``vector`` under ``key``; ``text`` (default: the key) is
+        what the lexical index sees."""
+        self._set_payload(key, payload)
+        if self.lexical is not None:
+            self.lexical.add(key, key if text is None else text)
+        if self.store is None:
+            self.vectors[key] = vector
+            return
+        row = self.store.add(key, vector)
+        if self.index is None:
+            return
+        if self.index.trained:
+            self.index.add(row, self.store.decode(slice(row, row + 1))[0])
+        elif len(self.store) >= self.index.min_train_size:
+            self.index.train(self.store)
+
+    def _set_payload(self, key: str, payload: Optional[dict]) -> None:
+        old = self.payloads.pop(key, None)
+        for field, partitions in self.payload_indexes.items():
+            if old is not None and field in old:
+                keys = partitions.get(old[field])
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del partitions[old[field]]
+            if payload is not None and field in payload:
+                partitions.setdefault(payload[field], set()).add(key)
+        if payload is not None:
+            self.payloads[key] = payload
+
+    def create_payload_index(self, field_name: str) -> None:
+        """Partitions keys by their value of ``field_name`` for filtering."""
+        partitions: Dict[Any, Set[str]] = {}
+        for key, payload in self.payloads.items():
+            if field_name in payload:
+                partitions.setdefault(payload[field_name], set()).add(key)
+        self.payload_indexes[field_name] = partitions
+
+    def _filter_keys(self, query_filter: Dict[str, Any]) -> List[str]:
+        # Indexed fields narrow the candidates first, smallest partition first
+        conditions = [
+            (field, value if isinstance(value, (list, tuple, set)) else [value])
+            for field, value in query_filter.items()
+        ]
+        indexed = sorted(
+            (
+                set().union(*(self.payload_indexes[field].get(v, ()) for v in values))
+                for field, values in conditions
+                if field in self.payload_indexes
+            ),
+            key=len,
+        )
+        if indexed:
+            candidates: Iterable[str] = indexed[0].intersection(*indexed[1:])
+        else:
+            candidates = self.payloads
+        scanned = [(field, values) for field, values in conditions if field not in self.payload_indexes]
+        return [
+            key
+            for key in candidates
+            if all(self.payloads.get(key, {}).get(field) in values for field, values in scanned)
+        ]
+
+    def delete(self, keys: Iterable[str]) -> int:
+        """Removes ``keys`` (vector, payload and lexical entry); returns how
+        many were present."""
+        deleted = 0
+        for key in list(keys):
+            self._set_payload(key, None)
+            if self.lexical is not None:
+                self.lexical.remove(key)
+            if self.store is None:
+                deleted += self.vectors.pop(key, None) is not None
+                continue
+            row = self.store.key_to_row.get(key)
+            if row is None:
+                continue
+            last = len(self.store) - 1
+            indexed = self.index is not None and self.index.trained
+            if indexed:
+                self.index.remove(row)
+                self.index.remove(last)
+            self.store.remove(key)
+            if indexed and row != last:
+                # The last row was moved into the freed slot
+                self.index.add(row, self.store.decode(slice(row, row + 1))[0])
+            deleted += 1
+        return deleted
+
+    def delete_by_filter(self, query_filter: Dict[str, Any]) -> int:
+        """Removes every entry whose payload matches ``query_filter``."""
+        return self.delete(self._filter_keys(query_filter))
+
+    def build_index(self) -> None:
+        """(Re)trains the ANN index on every stored vector."""
+        if self.index is None:
+            raise ValueError("VectorDatabase was created without an index")
+        if len(self.store):
+            self.index.train(self.store)
 
     def search(
         self,
         query_vector: np.array,
         k: int,
         distance_measure: Callable = cosine_similarity,
+        prefilter: Optional[str] = None,
+        query_filter: Optional[Dict[str, Any]] = None,
     ) -> List[Tuple[str, float]]:
+        """The ``k`` nearest keys to ``query_vector``, best first.
+
+        :param prefilter: Only score entries whose text contains every term
+            of this string, looked up in the lexical index. The candidates
+            are scored exactly, so this is both cheaper and more precise than
+            a full or approximate scan when the terms are selective.
+        :param query_filter: Only score entries whose payload matches, e.g.
+            ``{"filename": "report.pdf"}``; also scored exactly.
+        """
+        if prefilter is not None or query_filter is not None:
+            if prefilter is not None and self.lexical is None:
+                raise ValueError("VectorDatabase was created without a lexical index")
+            keys = None
+            if query_filter is not None:
+                keys = self._filter_keys(query_filter)
+            if prefilter is not None:
+                matching = self.lexical.matching(prefilter)
+                keys = matching if keys is None else list(set(keys).intersection(matching))
+            return self._search_keys(query_vector, keys, k, distance_measure)
+        if self.store is not None and distance_measure is cosine_similarity:
+            return self.search_many([query_vector], k)[0]
         scores = [
             (key, distance_measure(query_vector, vector))
-            for key, vector in self.vectors.items()
+            for key, vector in self._items()
         ]
         return sorted(scores, key=lambda x: x[1], reverse=True)[:k]
 
+    def _search_keys(
+        self,
+        query_vector: np.array,
+        keys: List[str],
+        k: int,
+        distance_measure: Callable,
+    ) -> List[Tuple[str, float]]:
+        if not keys:
+            return []
+        if self.store is None or distance_measure is not cosine_similarity:
+            scores = [
+                (key, distance_measure(query_vector, self.retrieve_from_key(key)))
+                for key in keys
+            ]
+            return sorted(scores, key=lambda x: x[1], reverse=True)[:k]
+        rows = np.fromiter(
+            (self.store.key_to_row[key] for key in keys), dtype=np.int64, count=len(keys)
+        )
+        scores = self.store.exact_scores(rows, normalize(query_vector))
+        top = top_k_indices(scores, k)
+        return [(keys[i], float(scores[i])) for i in top]
+
+    def query_points(
+        self,
+        query_vector: np.array,
+        limit: int = 10,
+        query_filter: Optional[Dict[str, Any]] = None,
+        prefilter: Optional[str] = None,
+    ) -> List[ScoredPoint]:
+        """Cosine search returning hits with their payloads, like
+        ``QdrantClient.query_points(...).points``."""
+        hits = self.search(query_vector, limit, prefilter=prefilter, query_filter=query_filter)
+        return [ScoredPoint(key, score, self.payloads.get(key)) for key, score in hits]
+
+    def search_many(
+        self,
+        query_vectors,
+        k: int,
+        distance_measure: Callable = cosine_similarity,
+    ) -> List[List[Tuple[str, float]]]:
+        """Runs :meth:`search` for a batch of queries.
+
+        With ``"matrix"`` storage and cosine similarity the whole batch is
+        scored with one matrix product (blockwise for quantized storage).
+        """
+        if self.store is None or distance_measure is not cosine_similarity:
+            return [
+                self.search(query_vector, k, distance_measure)
+                for query_vector in query_vectors
+            ]
+        if len(query_vectors) == 0:
+            return []
+        queries = normalize(np.atleast_2d(np.asarray(query_vectors)))
+        if len(self.store) == 0:
+            return [[] for _ in range(queries.shape[0])]
+        n_candidates = max(k, self.rescore)
+        if self.index is not None and self.index.trained:
+            hits = [self.index.search(self.store, query, n_candidates) for query in queries]
+        else:
+            hits = []
+            for row_scores in self.store.score(queries):
+                top = top_k_indices(row_scores, n_candidates)
+                hits.append((top, row_scores[top]))
+        results = []
+        for query, (rows, scores) in zip(queries, hits):
+            if self.rescore:
+                scores = self.store.exact_scores(rows, query)
+                order = top_k_indices(scores, k)
+                rows, scores = rows[order], scores[order]
+            keys = self.store.keys
+            results.append([(keys[i], float(s)) for i, s in zip(rows[:k], scores[:k])])
+        return results
+
     def search_by_text(
         self,
         query_text: str,
         k: int,
         distance_measure: Callable = cosine_similarity,
         return_as_text: bool = False,
+        prefilter: Optional[str] = None,
     ) -> List[Tuple[str, float]]:
         query_vector = self.embedding_model.get_embedding(query_text)
-        results = self.search(query_vector, k, distance_measure)
+        results = self.search(query_vector, k, distance_measure, prefilter=prefilter)
         return [result[0] for result in results] if return_as_text else results
 
+    def hybrid_search_by_text(
+        self,
+        query_text: str,
+        k: int,
+        n_candidates: int = 50,
+        rrf_k: int = 60,
+        weights: Optional[Tuple[float, float]] = None,
+        return_as_text: bool = False,
+    ) -> List[Tuple[str, float]]:
+        """Fuses the top ``n_candidates`` vector and BM25 hits by reciprocal
+        rank fusion. Scores are fused RRF scores; ``weights`` is
+        (vector, lexical)."""
+        if self.lexical is None:
+            raise ValueError("VectorDatabase was created without a lexical index")
+        dense = self.search_by_text(query_text, n_candidates)
+        lexical = self.lexical.search(query_text, n_candidates)
+        results = reciprocal_rank_fusion(
+            [[key for key, _ in dense], [key for key, _ in lexical]], k=rrf_k, weights=weights
+        )[:k]
+        return [result[0] for result in results] if return_as_text else results
+
+    def search_many_by_text(
+        self,
+        query_texts: List[str],
+        k: int,
+        distance_measure: Callable = cosine_similarity,
+        return_as_text: bool = False,
+    ) -> List[List[Tuple[str, float]]]:
+        query_vectors = self.embedding_model.get_embeddings(query_texts)
+        results = self.search_many(query_vectors, k, distance_measure)
+        if return_as_text:
+            return [[result[0] for result in hits] for hits in results]
+        return results
+
     def retrieve_from_key(self, key: str) -> np.array:
+        """Returns the stored vector; unit-normalized with ``"matrix"`` storage."""
+        if self.store is not None:
+            return self.store.get(key)
         return self.vectors.get(key, None)
 
+    def memory_footprint(self) -> dict:
+        """Bytes used by the stored vectors, overall and per vector."""
+        if self.store is not None:
+            dtype, total = self.store.dtype, self.store.nbytes()
+        else:
+            dtype = "object"
+            total = sum(np.asarray(vector).nbytes for vector in self.vectors.values())
+        count = len(self)
+        return {
+            "dtype": dtype,
+            "vectors": count,
+            "bytes": total,
+            "bytes_per_vector": total / count if count else 0.0,
+        }
+
+    def _items(self):
+        if self.store is not None:
+            matrix = self.store.decode()
+            return ((key, matrix[row]) for row, key in enumerate(self.store.keys))
+        return self.vectors.items()
+
+    def save(self, path: str) -> None:
+        """Writes the database to the directory ``path``.
+
+        Layout: ``vectors.<f32|f16|i8>`` is the raw row-major matrix of unit
+        vectors in the storage dtype, ``scales.f32`` the per-row int8 scales,
+        ``exact.f32`` the float32 copy kept for re-scoring, ``ivf.npz`` the
+        trained index (centroids and row assignments), ``lexical.npz`` the
+        BM25 postings (documents referenced by row) and ``meta.json`` the
+        shape, dtype, keys and payloads (which must be JSON-serializable). Files are written under temporary names and
+        swapped in, with ``meta.json`` last.
+        """
+        os.makedirs(path, exist_ok=True)
+        if self.store is not None:
+            store = self.store
+        else:
+            store = MatrixStore(max(1, len(self.vectors)))
+            for key, vector in self.vectors.items():
+                store.add(key, vector)
+        meta = {
+            "format_version": 1,
+            "dtype": store.dtype,
+            "size": len(store),
+            "dim": store.dim,
+            "rescore": self.rescore,
+            "keys": store.keys,
+        }
+        if self.payloads:
+            meta["payloads"] = [self.payloads.get(key) for key in store.keys]
+            meta["payload_indexes"] = list(self.payload_indexes)
+        arrays = {
+            f"vectors.{STORAGE_DTYPES[store.dtype]}": store.view(),
+            "scales.f32": None if store.scales is None else store.scales[: store.size],
+            "exact.f32": None if store.exact is None else store.exact[: store.size],
+        }
+        for name, array in arrays.items():
+            _write_array(os.path.join(path, name), array)
+        index_path = os.path.join(path, "ivf.npz")
+        if self.index is not None and self.index.trained:
+            meta["index"] = {"type": "ivf", "nlist": self.index.nlist, "nprobe": self.index.nprobe}
+            with open(index_path + ".tmp", "wb") as f:
+                np.savez(f, centroids=self.index.centroids, assignment=self.index.assignment(len(store)))
+            os.replace(index_path + ".tmp", index_path)
+        elif os.path.exists(index_path):
+            os.remove(index_path)
+        lexical_path = os.path.join(path, "lexical.npz")
+        if self.lexical is not None:
+            meta["lexical"] = {"type": "bm25", "k1": self.lexical.k1, "b": self.lexical.b}
+            rows = np.array(
+                [-1 if key is None else store.key_to_row[key] for key in self.lexical.keys],
+                dtype=np.int64,
+            )
+            with open(lexical_path + ".tmp", "wb") as f:
+                np.savez(f, rows=rows, **self.lexical.to_arrays())
+            os.replace(lexical_path + ".tmp", lexical_path)
+        elif os.path.exists(lexical_path):
+            os.remove(lexical_path)
+        meta_path = os.path.join(path, "meta.json")
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        embedding_model: EmbeddingModel = None,
+        mmap_mode: Optional[str] = "c",
+    ) -> "VectorDatabase":
+        """Opens a store written by :meth:`save` as ``"matrix"`` storage.
+
+        With the default ``mmap_mode="c"`` the vectors are memory-mapped
+        copy-on-write: nothing is read up front, and processes that load the
+        same store share its pages through the OS page cache. Inserts past the
+        mapped rows move the matrix into private memory. Pass ``None`` to read
+        the vectors into memory instead. The float32 copy kept for
+        re-scoring is always memory-mapped, since searches only read the
+        rows they re-score.
+        """
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format_version") != 1:
+            raise ValueError(f"Unsupported vector store format in '{path}'")
+        dtype = meta["dtype"]
+        shape = (meta["size"], meta["dim"])
+        index = None
+        if "index" in meta:
+            index = IVFIndex(nlist=meta["index"]["nlist"], nprobe=meta["index"]["nprobe"])
+            with np.load(os.path.join(path, "ivf.npz")) as arrays:
+                index.restore(arrays["centroids"], arrays["assignment"])
+        lexical = None
+        if "lexical" in meta:
+            with np.load(os.path.join(path, "lexical.npz")) as arrays:
+                keys = [None if row < 0 else meta["keys"][row] for row in arrays["rows"].tolist()]
+                lexical = BM25Index.from_arrays(
+                    arrays, keys, k1=meta["lexical"]["k1"], b=meta["lexical"]["b"]
+                )
+        db = cls(
+            embedding_model=embedding_model,
+            storage="matrix",
+            index=index,
+            dtype=dtype,
+            rescore=meta["rescore"],
+            lexical=lexical,
+        )
+        for key, payload in zip(meta["keys"], meta.get("payloads", [])):
+            if payload is not None:
+                db.payloads[key] = payload
+        for field_name in meta.get("payload_indexes", []):
+            db.create_payload_index(field_name)
+        if meta["size"]:
+            vectors_name = f"vectors.{STORAGE_DTYPES[dtype]}"
+            db.store = MatrixStore.from_arrays(
+                meta["keys"],
+                _open_array(os.path.join(path, vectors_name), dtype, shape, mmap_mode),
+                scales=_open_array(os.path.join(path, "scales.f32"), np.float32, shape[:1], mmap_mode),
+                exact=_open_array(os.path.join(path, "exact.f32"), np.float32, shape, mmap_mode or "c"),
+                dtype=dtype,
+            )
+        return db
+
     async def abuild_from_list(self, list_of_text: List[str]) -> "VectorDatabase":
         embeddings = await self.embedding_model.async_get_embeddings(list_of_text)
         for text, embedding in zip(list_of_text, embeddings):
@@ -1,43 +1,70 @@
 # Import required FastAPI components for building the API
-from fastapi import FastAPI, HTTPException, UploadFile, File
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Request
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 # Import Pydantic for data validation and settings management
 from pydantic import BaseModel
-# Import OpenAI client for interacting with OpenAI's API
-from openai import OpenAI
 from dotenv import load_dotenv
+import logging
 import os
 # Add current directory to Python path for aimakerspace imports
 import sys
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'))
+# Request timings (see metrics.py) are logged as JSON lines at INFO
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 from typing import Optional
+from contextlib import asynccontextmanager
+import asyncio
 import shutil
-from aimakerspace.text_utils import PDFLoader, CharacterTextSplitter
-from qdrant_client import QdrantClient
-from qdrant_client.http import models as qmodels
-from collections import Counter
-import nltk
 import tempfile
+# Heavy SDKs (openai, qdrant_client, PyPDF2) are imported on first use or by
+# the background warm-up below, never at import time, to keep cold starts fast
+from resources import DEFAULT_CHAT_MODEL, Resources
+from indexing import backfill_catalog, delete_pdf, index_pdf, prune_term_stats
+from retrieval import hybrid_search
+from aimakerspace.openai_utils.prompts import ContextChunk, SystemRolePrompt, UserRolePrompt, pack_context
+from jobs import Job
+from metrics import CHAT_REQUESTS, CHAT_STAGE_SECONDS, CHAT_TOKENS, CHAT_TOKENS_PER_SECOND, REGISTRY, Spans
+
+logger = logging.getLogger(__name__)
+
+# The resource registry, with the one-off catalog backfill queued behind it
+def create_resources() -> Resources:
+    resources = Resources()
+
+    async def backfill(job: Job) -> dict:
+        try:
+            return {"added": await backfill_catalog(resources, job.progress)}
+        except Exception as e:
+            logger.warning("Catalog backfill failed: %s", e)
+            raise
+
+    # Documents stored before the catalog moved into the vector store get
+    # their records from one scan of the store, off the request path
+    resources.jobs.submit("backfill_catalog", "", backfill)
+    return resources
+
+# Shared OpenAI/Qdrant clients are created once per process and closed on shutdown
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.resources = create_resources()
+    if os.getenv("WARMUP", "1") == "1":
+        # Import SDKs and build clients off the event loop; /api/health and the
+        # first requests do not wait for it
+        asyncio.get_running_loop().run_in_executor(None, app.state.resources.warm_up)
+    yield
+    await app.state.resources.aclose()
 
-# Set NLTK data path to writable directory for serverless
-nltk_data_dir = '/tmp/nltk_data'
-os.makedirs(nltk_data_dir, exist_ok=True)
-nltk.data.path.append(nltk_data_dir)
-
-# Download stopwords to the temp directory
-try:
-    nltk.download('stopwords', download_dir=nltk_data_dir, quiet=True)
-except Exception as e:
-    print(f"Warning: Could not download NLTK stopwords: {e}")
-    # Fallback to basic stopwords if download fails
-
-from nltk.corpus import stopwords
-import string
-from aimakerspace.openai_utils.embedding import EmbeddingModel
 # Initialize FastAPI application with a title
-app = FastAPI(title="OpenAI Chat API")
+app = FastAPI(title="OpenAI Chat API", lifespan=lifespan)
+
+# Dependency that hands endpoints the shared resource registry. Runtimes that
+# skip lifespan events (some serverless hosts) get one built on first use
+async def get_resources(request: Request) -> Resources:
+    if getattr(request.app.state, "resources", None) is None:
+        request.app.state.resources = create_resources()
+    return request.app.state.resources
 
 # Configure CORS (Cross-Origin Resource Sharing) middleware
 # This allows the API to be accessed from different domains/origins
@@ -49,65 +76,140 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers in requests
 )
 
+# Chat prompt templates, parsed once at import
+RAG_SYSTEM_PROMPT = SystemRolePrompt("You are a helpful assistant that answers questions using the provided PDF context.")
+RAG_USER_PROMPT = UserRolePrompt(
+    "You are an assistant with access to the following PDF context. Use it to answer the user's question."
+    "\n\nContext:\n{context}\n\nUser question: {question}"
+)
+
 # Define the data model for chat requests using Pydantic
 # This ensures incoming request data is properly validated
 class ChatRequest(BaseModel):
     developer_message: str  # Message from the developer/system
     user_message: str      # Message from the user
-    model: Optional[str] = "gpt-4.1-mini"  # Optional model selection with default
+    model: Optional[str] = DEFAULT_CHAT_MODEL  # Optional model selection with default
     pdf_filename: str      # The filename of the PDF to use for RAG
 
+# Answers to near-duplicate questions are replayed from the semantic answer
+# cache (see SemanticCache). An answer is cached only once fully streamed
+async def replay_answer(pieces):
+    for piece in pieces:
+        yield piece
+
+async def record_answer(stream, resources: Resources, partition, query_embedding):
+    pieces = []
+    async for piece in stream:
+        pieces.append(piece)
+        yield piece
+    resources.answer_cache.put(partition, query_embedding, tuple(pieces))
+
+# The model stream with its first token, already awaited by the endpoint, put
+# back in front
+async def resume_stream(first, stream):
+    if first is None:
+        return
+    yield first
+    async for piece in stream:
+        yield piece
+
+# Times the answer stream: first token (from the start of the request),
+# tokens per second after it (model streams only, not cache replays), and
+# the total once the last token is sent
+async def timed_stream(stream, spans: Spans, outcome: str):
+    generated = outcome == "generated"
+    tokens = 0
+    first_token_at = None
+    try:
+        async for piece in stream:
+            if first_token_at is None:
+                first_token_at = spans.elapsed()
+                spans.add("first_token", first_token_at)
+            tokens += 1
+            yield piece
+    except BaseException as e:
+        # A client disconnect cancels the stream mid-answer
+        if isinstance(e, (GeneratorExit, asyncio.CancelledError)):
+            outcome = "cancelled"
+        elif isinstance(e, asyncio.TimeoutError):
+            # The model went quiet for longer than CHAT_IDLE_TIMEOUT
+            outcome = "timeout"
+        else:
+            outcome = "error"
+        raise
+    finally:
+        streaming_s = spans.elapsed() - (first_token_at or 0.0)
+        if generated and tokens > 1 and streaming_s > 0:
+            CHAT_TOKENS_PER_SECOND.observe(tokens / streaming_s)
+        CHAT_TOKENS.inc(tokens)
+        CHAT_REQUESTS.inc(outcome=outcome)
+        spans.finish(outcome=outcome, tokens=tokens)
+
 # Define the main chat endpoint that handles POST requests
+# Every step awaits async I/O, so one worker can serve many chats at once
 @app.post("/api/chat")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, resources: Resources = Depends(get_resources)):
+    spans = Spans("chat", CHAT_STAGE_SECONDS)
     try:
-        # Initialize OpenAI client with the API key from the environment
-        api_key = os.getenv("OPENAI_API_KEY")
-        print("OPENAI_API_KEY:", api_key)
-        if not api_key:
+        # Make sure the OpenAI API key is configured on the backend
+        if not os.getenv("OPENAI_API_KEY"):
             raise HTTPException(status_code=500, detail="OPENAI_API_KEY environment variable is not set on the backend.")
-        client = OpenAI(api_key=api_key)
         # Generate embedding for user query
-        embedder = EmbeddingModel()
-        query_embedding = embedder.get_embedding(request.user_message)
-        # Search Qdrant for relevant chunks for the selected PDF
-        qdrant_client = QdrantClient(
-            url=os.getenv("QDRANT_URL"),
-            api_key=os.getenv("QDRANT_API_KEY"),
-        )
-        collection_name = os.getenv("QDRANT_COLLECTION", "pdf_vectors")
-        search_result = qdrant_client.search(
-            collection_name=collection_name,
-            query_vector=query_embedding,
-            limit=3,
-            query_filter=qmodels.Filter(
-                must=[
-                    qmodels.FieldCondition(
-                        key="filename",
-                        match=qmodels.MatchValue(value=request.pdf_filename)
-                    )
-                ]
+        with spans.span("embed"):
+            query_embedding = await resources.embedder.async_get_embedding(request.user_message)
+        if resources.answer_cache_enabled:
+            with spans.span("cache_lookup"):
+                # Cached answers are per PDF version and model. The version
+                # comes from the shared catalog, so an upload on another
+                # instance retires this one's cached answers too
+                record = await resources.vector_store.get_record(request.pdf_filename)
+                content_hash = record and record["content_hash"]
+                partition = (request.pdf_filename, content_hash, request.model)
+                cached = resources.answer_cache.get(partition, query_embedding)
+            if cached is not None:
+                headers = {"X-Answer-Cache": "hit", "Server-Timing": spans.server_timing()}
+                return StreamingResponse(timed_stream(replay_answer(cached), spans, "cache_hit"), media_type="text/plain", headers=headers)
+        # Retrieve the most relevant chunks of the selected PDF: vector-store
+        # hits fused with BM25 keyword hits (see retrieval.py)
+        with spans.span("search"):
+            hits = await asyncio.wait_for(
+                hybrid_search(resources, request.pdf_filename, request.user_message, query_embedding, k=resources.context_chunks),
+                resources.search_timeout,
+            )
+        # Overlapping neighbours are merged, then passages added best first
+        # until the token budget is spent
+        with spans.span("pack"):
+            from aimakerspace.openai_utils.tokenizer import aget_encoding
+
+            # The model's encoding may still have to be downloaded
+            await aget_encoding(request.model)
+            context = pack_context(
+                [ContextChunk(hit["chunk"], hit.get("content_hash"), hit.get("chunk_index"), hit.get("start"), hit.get("end")) for hit in hits],
+                resources.context_max_tokens,
+                model_name=request.model,
             )
-        )
-        relevant_chunks = [hit.payload["chunk"] for hit in search_result]
-        context = "\n---\n".join(relevant_chunks)
-        rag_prompt = f"You are an assistant with access to the following PDF context. Use it to answer the user's question.\n\nContext:\n{context}\n\nUser question: {request.user_message}"
         messages = [
-            {"role": "system", "content": "You are a helpful assistant that answers questions using the provided PDF context."},
-            {"role": "user", "content": rag_prompt}
+            RAG_SYSTEM_PROMPT.create_message(),
+            RAG_USER_PROMPT.create_message(context=context.text, question=request.user_message),
         ]
-        # Create an async generator function for streaming responses
-        async def generate():
-            stream = client.chat.completions.create(
-                model=request.model,
-                messages=messages,
-                stream=True
-            )
-            for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    yield chunk.choices[0].delta.content
-        return StreamingResponse(generate(), media_type="text/plain")
+        # Stream tokens straight from the async OpenAI client. The first one is
+        # awaited here (retried on a slow or failed start), so a model that
+        # never starts answering is a 504 rather than an empty 200
+        chat_model = resources.chat_model(request.model)
+        stream = chat_model.astream(messages)
+        stream = resume_stream(await anext(stream, None), stream)
+        if resources.answer_cache_enabled:
+            stream = record_answer(stream, resources, partition, query_embedding)
+        return StreamingResponse(timed_stream(stream, spans, "generated"), media_type="text/plain", headers={"Server-Timing": spans.server_timing()})
+    except asyncio.TimeoutError:
+        # A stage ran past its deadline (EMBED_TIMEOUT, SEARCH_TIMEOUT or
+        # CHAT_FIRST_TOKEN_TIMEOUT, retries included)
+        CHAT_REQUESTS.inc(outcome="timeout")
+        spans.finish(outcome="timeout")
+        raise HTTPException(status_code=504, detail="Upstream request timed out")
     except Exception as e:
+        CHAT_REQUESTS.inc(outcome="error")
+        spans.finish(outcome="error")
         raise HTTPException(status_code=500, detail=str(e))
 
 # Define a health check endpoint to verify API status
@@ -115,100 +217,97 @@ async def chat(request: ChatRequest):
 async def health_check():
     return {"status": "ok"}
 
-qdrant_client = QdrantClient(
-    url=os.getenv("QDRANT_URL"),
-    api_key=os.getenv("QDRANT_API_KEY"),
-)
-collection_name = os.getenv("QDRANT_COLLECTION", "pdf_vectors")
+# Chat and upload latency histograms and counters, in Prometheus text format
+@app.get("/api/metrics")
+async def metrics():
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Hit/miss counters for the shared embedding cache, plus how chat query
+# embeddings were coalesced into batched requests
+@app.get("/api/embedding_cache")
+async def embedding_cache_stats(resources: Resources = Depends(get_resources)):
+    stats = resources.embedding_cache.stats()
+    coalescer = resources.embedder.coalescer
+    if coalescer is not None:
+        stats["coalescer"] = coalescer.stats()
+    hedger = resources.embedder.hedger
+    if hedger is not None:
+        stats["hedger"] = hedger.stats()
+    return stats
+
+# Hit/miss counters for the semantic answer cache
+@app.get("/api/answer_cache")
+async def answer_cache_stats(resources: Resources = Depends(get_resources)):
+    return resources.answer_cache.stats()
+
+# Top words across every indexed PDF, or of one PDF with ?filename=. Read from
+# the term counts stored at indexing time, less those of versions the catalog
+# no longer lists; no PDF is parsed
+@app.get("/api/analytics")
+async def analytics(filename: Optional[str] = None, limit: int = 20, resources: Resources = Depends(get_resources)):
+    await prune_term_stats(resources)
+    stats = resources.term_stats
+    top_words = await asyncio.to_thread(stats.top_terms, limit, filename)
+    if filename is not None and not top_words and await asyncio.to_thread(stats.content_hash, filename) is None:
+        raise HTTPException(status_code=404, detail="No analytics for this file.")
+    return {"filename": filename, "analytics": [{"word": w, "count": c} for w, c in top_words], "documents": await asyncio.to_thread(stats.documents)}
+
+async def list_filenames(resources: Resources) -> list:
+    return [record["filename"] for record in await resources.vector_store.records()]
+
+# Indexed PDFs from the document catalog kept in the vector store: name,
+# content hash, chunk and page counts, and when they were indexed (Unix
+# time). One record per PDF is read; no vectors are scanned
+@app.get("/api/documents")
+async def list_documents(resources: Resources = Depends(get_resources)):
+    return {"documents": await resources.vector_store.records()}
+
+# Removes a PDF's chunks and everything derived from it. Chunks stored
+# before the catalog existed are deleted even if not yet backfilled
+@app.delete("/api/documents/{filename}")
+async def delete_document(filename: str, resources: Resources = Depends(get_resources)):
+    record = await resources.vector_store.get_record(filename)
+    chunks = await delete_pdf(resources, filename)
+    if record is None and not chunks:
+        raise HTTPException(status_code=404, detail="Unknown document.")
+    return {"filename": filename, "deleted_chunks": chunks}
 
-@app.post("/api/upload_pdf")
-async def upload_pdf(file: UploadFile = File(...)):
+# Uploads are indexed by a background job (see jobs.py); the response carries
+# the job ID straight away and /api/jobs/{id} reports progress and the result
+@app.post("/api/upload_pdf", status_code=202)
+async def upload_pdf(file: UploadFile = File(...), resources: Resources = Depends(get_resources)):
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed.")
-    # Use /tmp for serverless compatibility (Vercel)
-    uploads_dir = "/tmp/uploads"
-    os.makedirs(uploads_dir, exist_ok=True)
-    file_path = os.path.join(uploads_dir, file.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    # Index the PDF using aimakerspace
-    try:
-        loader = PDFLoader(file_path)
-        documents = loader.load_documents()  # List of extracted text
-        splitter = CharacterTextSplitter(chunk_size=500, chunk_overlap=100)
-        chunks = []
-        for doc in documents:
-            for chunk in splitter.split(doc):
-                if len(chunk) <= 4000:  # Safety net
-                    chunks.append(chunk)
-        print(f"Number of chunks: {len(chunks)}")
-        print(f"Max chunk length: {max(len(chunk) for chunk in chunks) if chunks else 0}")
-        if chunks:
-            print(f"First chunk: {chunks[0][:200]}")
-        # Recreate the collection to ensure it has the proper filename index
-        print("Recreating collection to ensure proper filename index...")
-        qdrant_client.recreate_collection(
-            collection_name=collection_name,
-            vectors_config=qmodels.VectorParams(
-                size=1536,  # for OpenAI embeddings
-                distance=qmodels.Distance.COSINE,
-            ),
-        )
-        # Create the filename payload index
-        qdrant_client.create_payload_index(
-            collection_name=collection_name,
-            field_name="filename",
-            field_type="keyword"
-        )
-        print(f"Collection '{collection_name}' recreated with filename index.")
-        # Generate embeddings for each chunk and upsert to Qdrant
-        embedder = EmbeddingModel()
-        embeddings = embedder.get_embeddings(chunks)
-        from uuid import uuid4
-        points = [
-            qmodels.PointStruct(
-                id=str(uuid4()),
-                vector=embedding,
-                payload={
-                    "filename": file.filename,
-                    "chunk": chunk,
-                    "chunk_index": i,
-                },
-            )
-            for i, (embedding, chunk) in enumerate(zip(embeddings, chunks))
-        ]
-        qdrant_client.upsert(
-            collection_name=collection_name,
-            points=points
-        )
-        # --- Analytics Extraction ---
-        # Combine all text for analytics
-        all_text = " ".join(documents)
-        # Lowercase, remove punctuation
-        all_text = all_text.lower().translate(str.maketrans('', '', string.punctuation))
-        # Tokenize
-        words = all_text.split()
-        # Remove stopwords (with fallback if not available)
+    # The request's spooled upload is closed once we respond, so keep a copy
+    # on disk (/tmp on serverless hosts) for the job to read
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as saved:
+        await asyncio.to_thread(shutil.copyfileobj, file.file, saved)
+    filename = file.filename
+
+    async def index_upload(job: Job) -> dict:
+        # Index the PDF incrementally (see indexing.py): pages -> chunks ->
+        # embeddings -> upserts, streamed; an unchanged re-upload touches nothing
         try:
-            stop_words = set(stopwords.words('english'))
-        except LookupError:
-            # Fallback basic stopwords if NLTK data not available
-            stop_words = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should', 'may', 'might', 'must', 'can', 'this', 'that', 'these', 'those', 'i', 'you', 'he', 'she', 'it', 'we', 'they', 'me', 'him', 'her', 'us', 'them'}
-        filtered_words = [w for w in words if w not in stop_words and len(w) > 2]
-        # Count frequencies
-        word_counts = Counter(filtered_words)
-        top_words = word_counts.most_common(20)
-        analytics = [{"word": w, "count": c} for w, c in top_words]
-        # --- End Analytics Extraction ---
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"PDF indexing failed: {str(e)}")
-    # Get all filenames in the collection
-    search_result = qdrant_client.scroll(collection_name=collection_name, limit=1000)
-    filenames = set()
-    for point in search_result[0]:
-        if "filename" in point.payload:
-            filenames.add(point.payload["filename"])
-    return {"filename": file.filename, "message": "PDF uploaded and indexed successfully.", "analytics": analytics, "uploaded_filenames": list(filenames)}
+            with open(saved.name, "rb") as pdf:
+                result = await index_pdf(resources, filename, pdf, progress=job.progress)
+        except Exception as e:
+            raise RuntimeError(f"PDF indexing failed: {str(e)}") from e
+        finally:
+            os.unlink(saved.name)
+        message = "PDF uploaded and indexed successfully." if result["status"] == "indexed" else "PDF unchanged; existing index reused."
+        return {"filename": filename, "message": message, "analytics": result["analytics"], "uploaded_filenames": await list_filenames(resources), "status": result["status"], "chunks": result["chunks"], "ingestion": result["ingestion"], "timings": result["timings"]}
+
+    job = resources.jobs.submit("upload_pdf", filename, index_upload)
+    return {"job_id": job.id, "filename": filename, "state": job.state}
+
+# Progress of a background job: state, current stage, chunks indexed so far,
+# and the error or the upload result once it has finished
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, resources: Resources = Depends(get_resources)):
+    job = resources.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job ID.")
+    return job.as_dict()
 
 # Entry point for running the application directly
 if __name__ == "__main__":
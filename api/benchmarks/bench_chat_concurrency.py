@@ -0,0 +1,130 @@
+"""Concurrent /api/chat streams against local stand-ins for OpenAI and the vector store.
+
+The embedding model, vector search and chat model are replaced by fakes that
+only ``await asyncio.sleep``. If the request path never blocks the event loop,
+N concurrent chats finish in roughly the time of one and their tokens are
+produced interleaved. Prints a JSON summary and exits non-zero otherwise.
+
+    python benchmarks/bench_chat_concurrency.py --streams 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-local-stand-in")
+import app as app_module
+from vector_store import Hit
+
+
+class FakeEmbedder:
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    async def async_get_embedding(self, text):
+        await asyncio.sleep(self.delay)
+        return [float(len(text)), 1.0]
+
+
+class FakeVectorStore:
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    async def search(self, vector, filename, limit):
+        await asyncio.sleep(self.delay)
+        return [Hit(str(i), 1.0, {"chunk": f"chunk {i}"}) for i in range(limit)]
+
+
+class FakeResources:
+    """Stands in for ``resources.Resources`` with sleep-only fakes."""
+
+    retrieval_candidates = 3
+    context_chunks = 3
+    context_max_tokens = 512
+    search_timeout = 10.0
+    hybrid_search = False
+    answer_cache_enabled = False
+
+    def __init__(self, args, events: list):
+        self.embedder = FakeEmbedder(args.embed_ms / 1000)
+        self.vector_store = FakeVectorStore(args.search_ms / 1000)
+        self.term_stats = SimpleNamespace(content_hash=lambda filename: None)
+        self.args = args
+        self.events = events
+
+    def chat_model(self, model_name):
+        return FakeChatModel(self.args.tokens, self.args.token_ms / 1000, self.events)
+
+
+class FakeChatModel:
+    def __init__(self, tokens: int, delay: float, events: list):
+        self.tokens = tokens
+        self.delay = delay
+        self.events = events
+
+    async def astream(self, messages, **kwargs):
+        stream_id = messages[-1]["content"].rsplit(" ", 1)[-1]
+        for i in range(self.tokens):
+            await asyncio.sleep(self.delay)
+            self.events.append(stream_id)
+            yield f"{stream_id}:{i} "
+
+
+async def run(args) -> dict:
+    events = []
+    fake_resources = FakeResources(args, events)
+    app_module.app.dependency_overrides[app_module.get_resources] = lambda: fake_resources
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://local") as client:
+
+        async def one_chat(i: int) -> str:
+            response = await client.post("/api/chat", json={
+                "developer_message": "",
+                "user_message": f"question s{i}",
+                "pdf_filename": "local.pdf",
+            })
+            response.raise_for_status()
+            return response.text
+
+        start = time.perf_counter()
+        bodies = await asyncio.gather(*(one_chat(i) for i in range(args.streams)))
+        elapsed = time.perf_counter() - start
+
+    single = (args.embed_ms + args.search_ms + args.tokens * args.token_ms) / 1000
+    # A stream switch in the event log means another chat produced a token in between
+    switches = sum(1 for a, b in zip(events, events[1:]) if a != b)
+    return {
+        "streams": args.streams,
+        "elapsed_s": round(elapsed, 4),
+        "single_stream_s": round(single, 4),
+        "serial_estimate_s": round(single * args.streams, 4),
+        "speedup_vs_serial": round(single * args.streams / elapsed, 2),
+        "stream_switches": switches,
+        "complete": all(body.count(":") == args.tokens for body in bodies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--streams", type=int, default=8)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--embed-ms", type=float, default=50)
+    parser.add_argument("--search-ms", type=float, default=30)
+    parser.add_argument("--token-ms", type=float, default=10)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print(json.dumps(result))
+    interleaved = args.streams < 2 or result["stream_switches"] >= args.streams
+    concurrent = result["elapsed_s"] < result["serial_estimate_s"] / 2
+    sys.exit(0 if result["complete"] and interleaved and concurrent else 1)
+
+
+if __name__ == "__main__":
+    main()
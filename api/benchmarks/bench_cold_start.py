@@ -0,0 +1,82 @@
+"""Cold start: time from launching the API process to its first /api/health.
+
+Starts ``uvicorn app:app`` in a fresh interpreter, polls /api/health until it
+answers, and reports the wall time (including interpreter start-up, which
+is measured separately as ``python_startup_s``). Also reports how long a bare
+``import app`` takes. Prints one JSON object.
+
+    python benchmarks/bench_cold_start.py --runs 5
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def child_env(warmup: str) -> dict:
+    env = dict(os.environ, WARMUP=warmup)
+    env.setdefault("OPENAI_API_KEY", "sk-local-stand-in")
+    return env
+
+
+def time_to_first_health(warmup: str, timeout: float = 30.0) -> float:
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=API_DIR,
+        env=child_env(warmup),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.005)
+        raise TimeoutError("API did not answer /api/health in time")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def time_command(code: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=API_DIR, env=child_env("0"), check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    result = {
+        "runs": args.runs,
+        "python_startup_s": statistics.median(time_command("pass") for _ in range(args.runs)),
+        "import_app_s": statistics.median(time_command("import app") for _ in range(args.runs)),
+    }
+    for warmup in ("0", "1"):
+        samples = [time_to_first_health(warmup) for _ in range(args.runs)]
+        result[f"first_health_s_warmup_{warmup}"] = statistics.median(samples)
+    print(json.dumps({key: round(value, 4) for key, value in result.items()}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Concurrent single-text query embeddings, one request each vs. coalesced.
+
+Simulates ``--callers`` chats embedding their question at the same moment
+against an embeddings endpoint with ``--latency-ms`` round trips and at most
+``--api-concurrency`` requests in flight (a connection or rate limit). A
+share of the questions repeat (``--duplicates``). Prints API requests made and
+per-call p50/p95 latency for each mode as JSON.
+
+    python benchmarks/bench_embedding_coalescing.py --callers 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aimakerspace.openai_utils.batching import EmbeddingBatcher
+from fakes import FakeEmbeddingModel
+
+
+class LimitedEmbeddingModel(FakeEmbeddingModel):
+    """A fake endpoint that serves at most ``api_concurrency`` requests at once."""
+
+    def __init__(self, api_concurrency: int, **kwargs):
+        super().__init__(**kwargs)
+        self._slots = asyncio.Semaphore(api_concurrency)
+
+    async def _async_embed_batch(self, list_of_text):
+        async with self._slots:
+            return await super()._async_embed_batch(list_of_text)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run(args, coalesce_window_s):
+    model = LimitedEmbeddingModel(
+        args.api_concurrency,
+        dim=64,
+        latency_s=args.latency_ms / 1000,
+        batcher=EmbeddingBatcher(max_concurrency=args.api_concurrency),
+        coalesce_window_s=coalesce_window_s,
+    )
+    rng = random.Random(0)
+    unique = max(1, int(args.callers * (1 - args.duplicates)))
+    questions = [f"question {rng.randrange(unique)} about the document" for _ in range(args.callers)]
+
+    async def ask(text):
+        start = time.perf_counter()
+        vector = await model.async_get_embedding(text)
+        return time.perf_counter() - start, vector
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(ask(text) for text in questions))
+    wall = time.perf_counter() - start
+    for text, (_, vector) in zip(questions, results):
+        assert vector == model.embed(text)
+    latencies = [seconds for seconds, _ in results]
+    report = {
+        "api_requests": model.requests,
+        "wall_s": round(wall, 4),
+        "p50_ms": round(1000 * statistics.median(latencies), 2),
+        "p95_ms": round(1000 * percentile(latencies, 0.95), 2),
+    }
+    if model.coalescer is not None:
+        report["coalescer"] = model.coalescer.stats()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--callers", type=int, default=200)
+    parser.add_argument("--duplicates", type=float, default=0.3, help="Share of questions asked more than once")
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--api-concurrency", type=int, default=8)
+    parser.add_argument("--window-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    report = {
+        "callers": args.callers,
+        "individual": asyncio.run(run(args, None)),
+        "coalesced": asyncio.run(run(args, args.window_ms / 1000)),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Serial vs process-pool PDF text extraction on the bundled PDFs.
+
+Times PDFLoader on each ``uploads/*.pdf`` file (page ranges split across
+workers) and on the whole ``uploads`` directory (files split across workers),
+checking that parallel output matches serial output. Prints one JSON object
+per measurement.
+
+    python benchmarks/bench_pdf_extraction.py --workers 4 --repeat 3
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+from aimakerspace.text_utils import PDFLoader
+
+UPLOADS_DIR = os.path.join(os.path.dirname(API_DIR), "uploads")
+
+
+def timed_load(path: str, workers: int, repeat: int):
+    samples, documents = [], None
+    for _ in range(repeat):
+        loader = PDFLoader(path, workers=workers)
+        start = time.perf_counter()
+        documents = loader.load_documents()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--uploads-dir", default=UPLOADS_DIR)
+    args = parser.parse_args()
+
+    import PyPDF2  # noqa: F401  (keep the import cost out of the first timing)
+
+    targets = sorted(glob.glob(os.path.join(args.uploads_dir, "*.pdf"))) + [args.uploads_dir]
+    for path in targets:
+        serial_s, serial_docs = timed_load(path, 1, args.repeat)
+        parallel_s, parallel_docs = timed_load(path, args.workers, args.repeat)
+        print(json.dumps({
+            "target": os.path.relpath(path, os.path.dirname(API_DIR)),
+            "workers": args.workers,
+            "serial_s": round(serial_s, 4),
+            "parallel_s": round(parallel_s, 4),
+            "speedup": round(serial_s / parallel_s, 2) if parallel_s else None,
+            "identical": serial_docs == parallel_docs,
+        }))
+
+
+if __name__ == "__main__":
+    main()
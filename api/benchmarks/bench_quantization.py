@@ -0,0 +1,72 @@
+"""Memory footprint and recall of quantized VectorDatabase storage.
+
+Builds the same synthetic store in every storage mode and compares each
+mode's top-k against float32 exact search. Prints one JSON object per mode.
+
+    python benchmarks/bench_quantization.py --vectors 20000 --dim 1536
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aimakerspace.vectordatabase import VectorDatabase
+
+MODES = [
+    {"dtype": "float32", "rescore": 0},
+    {"dtype": "float16", "rescore": 0},
+    {"dtype": "int8", "rescore": 0},
+    {"dtype": "int8", "rescore": 100},
+]
+
+
+def clustered_vectors(n: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    # Embeddings of real text cluster by topic; pure noise would flatter recall
+    centers = rng.normal(size=(max(1, n // 100), dim))
+    return centers[rng.integers(0, centers.shape[0], n)] + 0.6 * rng.normal(size=(n, dim))
+
+
+def recall(results, reference) -> float:
+    hits = [
+        len({key for key, _ in got} & {key for key, _ in want}) / max(1, len(want))
+        for got, want in zip(results, reference)
+    ]
+    return float(np.mean(hits))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    data = clustered_vectors(args.vectors, args.dim, rng)
+    queries = data[rng.integers(0, args.vectors, args.queries)] + 0.3 * rng.normal(
+        size=(args.queries, args.dim)
+    )
+    reference = None
+    for mode in MODES:
+        db = VectorDatabase(embedding_model=object(), storage="matrix", **mode)
+        for i, vector in enumerate(data):
+            db.insert(str(i), vector)
+        start = time.perf_counter()
+        results = [db.search(query, args.k) for query in queries]
+        latency_ms = (time.perf_counter() - start) * 1000 / args.queries
+        reference = reference or results
+        print(json.dumps({
+            **mode,
+            **db.memory_footprint(),
+            f"recall@{args.k}": round(recall(results, reference), 4),
+            "search_ms": round(latency_ms, 3),
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""Deadlines, retries and hedging against a local fake OpenAI server.
+
+Serves fake ``/v1/embeddings`` and streamed ``/v1/chat/completions``
+endpoints with uvicorn on a local port and points the real ``AsyncOpenAI``
+client at them. The server injects latency (a ``--slow-rate`` share of
+embedding requests take ``--slow-ms``), 500 errors and stalls before or
+during a chat stream. Checks that:
+
+- hedged query embeddings cut the tail latency,
+- retryable errors are retried until they succeed,
+- a query embedding gives up at its deadline,
+- a chat whose first token is late is retried, and one that stalls
+  mid-stream is cut off.
+
+Prints a JSON report and exits non-zero if a check fails.
+
+    python benchmarks/bench_resilience.py --calls 300
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import sys
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.requests import ClientDisconnect
+from openai import AsyncOpenAI
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aimakerspace.openai_utils.batching import EmbeddingBatcher
+from aimakerspace.openai_utils.chatmodel import ChatOpenAI
+from aimakerspace.openai_utils.embedding import EmbeddingModel
+from aimakerspace.openai_utils.resilience import Hedger, RetryPolicy
+
+
+class Faults:
+    """What the fake server does to the next requests; set between checks."""
+
+    def __init__(self):
+        self.rng = random.Random(0)
+        self.reset()
+
+    def reset(self):
+        self.embed_ms = 10.0
+        self.slow_rate = 0.0
+        self.slow_ms = 0.0
+        self.error_rate = 0.0
+        self.first_token_stalls = 0  # chat requests left that stall before answering
+        self.stall_s = 0.0
+        self.stall_after_tokens = None  # stall every stream after this many tokens
+        self.embedding_requests = 0
+        self.chat_requests = 0
+
+
+faults = Faults()
+server_app = FastAPI()
+
+
+@server_app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    try:
+        body = await request.json()
+    except ClientDisconnect:  # the losing copy of a hedged request
+        return Response(status_code=499)
+    faults.embedding_requests += 1
+    if faults.rng.random() < faults.error_rate:
+        return JSONResponse({"error": {"message": "injected", "type": "server_error"}}, status_code=500)
+    slow = faults.rng.random() < faults.slow_rate
+    await asyncio.sleep((faults.slow_ms if slow else faults.embed_ms) / 1000)
+    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    data = [
+        {"object": "embedding", "index": i, "embedding": [float(len(text)), 1.0, 0.0]}
+        for i, text in enumerate(inputs)
+    ]
+    usage = {"prompt_tokens": 0, "total_tokens": 0}
+    return {"object": "list", "data": data, "model": body["model"], "usage": usage}
+
+
+def _chunk(content):
+    choice = {"index": 0, "delta": {"content": content}, "finish_reason": None}
+    chunk = {"id": "fake", "object": "chat.completion.chunk", "created": 0, "model": "fake", "choices": [choice]}
+    return "data: " + json.dumps(chunk) + "\n\n"
+
+
+@server_app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    await request.json()
+    faults.chat_requests += 1
+    stall_first = faults.first_token_stalls > 0
+    faults.first_token_stalls -= stall_first
+
+    async def events():
+        if stall_first:
+            await asyncio.sleep(faults.stall_s)
+        for i in range(20):
+            if i == faults.stall_after_tokens:
+                await asyncio.sleep(faults.stall_s)
+            yield _chunk(f"token{i} ")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def start_server():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(server_app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, thread, f"http://127.0.0.1:{port}/v1"
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+
+    def at(q):
+        return round(1000 * latencies[min(len(latencies) - 1, int(q * len(latencies)))], 1)
+
+    return {"p50_ms": round(1000 * statistics.median(latencies), 1), "p95_ms": at(0.95), "p99_ms": at(0.99)}
+
+
+def embedder(client, retry=RetryPolicy(max_retries=0), **kwargs):
+    batcher = EmbeddingBatcher(max_retries=retry.max_retries, backoff_base=retry.backoff_base)
+    return EmbeddingModel(async_client=client, batcher=batcher, **kwargs)
+
+
+async def embed_latencies(model, calls, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await model.async_get_embedding(f"question {i}")
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    return latencies
+
+
+async def check_hedging(client, args):
+    faults.reset()
+    faults.slow_rate, faults.slow_ms = args.slow_rate, args.slow_ms
+    plain = percentiles(await embed_latencies(embedder(client), args.calls, args.concurrency))
+    hedger = Hedger(min_delay_s=0.02)
+    hedged_model = embedder(client, hedger=hedger)
+    hedged = percentiles(await embed_latencies(hedged_model, args.calls, args.concurrency))
+    return {
+        "unhedged": plain,
+        "hedged": {**hedged, **hedger.stats()},
+        "ok": hedged["p99_ms"] < plain["p99_ms"] / 2 and hedger.hedged < 0.2 * args.calls,
+    }
+
+
+async def check_retries(client):
+    faults.reset()
+    faults.error_rate = 0.3
+    model = embedder(client, retry=RetryPolicy(max_retries=6, backoff_base=0.01))
+    latencies = await embed_latencies(model, 100, 10)
+    return {
+        "calls": len(latencies),
+        "requests": faults.embedding_requests,
+        "ok": len(latencies) == 100 and faults.embedding_requests > 100,
+    }
+
+
+async def check_embed_deadline(client):
+    faults.reset()
+    faults.embed_ms = 5000
+    model = embedder(client, retry=RetryPolicy(max_retries=3, backoff_base=0.01), query_timeout_s=0.3)
+    start = time.perf_counter()
+    try:
+        await model.async_get_embedding("never answered")
+        timed_out = False
+    except asyncio.TimeoutError:
+        timed_out = True
+    elapsed = time.perf_counter() - start
+    return {"timed_out": timed_out, "elapsed_s": round(elapsed, 3), "ok": timed_out and elapsed < 0.6}
+
+
+async def check_first_token(client):
+    faults.reset()
+    faults.first_token_stalls, faults.stall_s = 1, 5.0
+    model = ChatOpenAI(async_client=client, retry=RetryPolicy(max_retries=2, backoff_base=0.01), first_token_timeout_s=0.3)
+    start = time.perf_counter()
+    tokens = [token async for token in model.astream([{"role": "user", "content": "hi"}])]
+    elapsed = time.perf_counter() - start
+    return {
+        "tokens": len(tokens),
+        "requests": faults.chat_requests,
+        "elapsed_s": round(elapsed, 3),
+        "ok": len(tokens) == 20 and faults.chat_requests == 2 and elapsed < 1.5,
+    }
+
+
+async def check_idle(client):
+    faults.reset()
+    faults.stall_after_tokens, faults.stall_s = 5, 5.0
+    model = ChatOpenAI(async_client=client, retry=RetryPolicy(max_retries=0), idle_timeout_s=0.3)
+    tokens = []
+    start = time.perf_counter()
+    try:
+        async for token in model.astream([{"role": "user", "content": "hi"}]):
+            tokens.append(token)
+        timed_out = False
+    except asyncio.TimeoutError:
+        timed_out = True
+    elapsed = time.perf_counter() - start
+    return {
+        "tokens_before_cutoff": len(tokens),
+        "timed_out": timed_out,
+        "elapsed_s": round(elapsed, 3),
+        "ok": timed_out and len(tokens) == 5 and elapsed < 1.0,
+    }
+
+
+async def run(args, base_url):
+    client = AsyncOpenAI(base_url=base_url, api_key="sk-local-stand-in", max_retries=0)
+    try:
+        return {
+            "hedging": await check_hedging(client, args),
+            "retries": await check_retries(client),
+            "embed_deadline": await check_embed_deadline(client),
+            "first_token_timeout": await check_first_token(client),
+            "idle_timeout": await check_idle(client),
+        }
+    finally:
+        await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=300, help="Query embeddings per hedging run")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--slow-rate", type=float, default=0.03)
+    parser.add_argument("--slow-ms", type=float, default=500.0)
+    args = parser.parse_args()
+
+    server, thread, base_url = start_server()
+    try:
+        report = asyncio.run(run(args, base_url))
+    finally:
+        server.should_exit = True
+        thread.join()
+    print(json.dumps(report, indent=2))
+    if not all(check["ok"] for check in report.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""Offline benchmark suite for the retrieval and ingestion hot paths.
+
+Runs without network access: OpenAI is replaced by the deterministic fakes
+in ``benchmarks/fakes.py`` and the API uses the local vector store. Covers
+
+- ``splitter``: CharacterTextSplitter.split_texts throughput,
+- ``pdf``: PDFLoader extraction of each bundled PDF,
+- ``search``: VectorDatabase.search latency and recall@k at 1k/10k/100k vectors,
+- ``api``: /api/upload_pdf (until its job finishes) and /api/chat latency
+  through the FastAPI TestClient.
+
+Prints one JSON object per result. ``--output`` also writes them, with the
+machine and library versions, to a file that a later run can compare
+against with ``--baseline``; the run then exits non-zero if any timing got
+slower (or throughput or recall lower) by more than ``--tolerance``.
+
+    python benchmarks/bench_suite.py --output before.json
+    python benchmarks/bench_suite.py --baseline before.json --only search,api
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from aimakerspace.ann import IVFIndex
+from aimakerspace.text_utils import CharacterTextSplitter, PDFLoader
+from aimakerspace.vectordatabase import VectorDatabase
+
+UPLOADS_DIR = os.path.join(os.path.dirname(API_DIR), "uploads")
+SECTIONS = ("splitter", "pdf", "search", "api")
+
+
+def ms(seconds: float) -> float:
+    return round(1000 * seconds, 3)
+
+
+def percentiles(samples) -> dict:
+    return {
+        "p50_ms": ms(float(np.percentile(samples, 50))),
+        "p95_ms": ms(float(np.percentile(samples, 95))),
+    }
+
+
+def bundled_pdfs(uploads_dir: str):
+    return sorted(glob.glob(os.path.join(uploads_dir, "*.pdf")))
+
+
+def load_pdf(path: str) -> str:
+    return PDFLoader(path).load_documents()[0]
+
+
+def bench_pdf(args):
+    for path in bundled_pdfs(args.uploads_dir):
+        samples, text = [], ""
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            text = load_pdf(path)
+            samples.append(time.perf_counter() - start)
+        seconds = statistics.median(samples)
+        size_mb = os.path.getsize(path) / 1e6
+        yield {
+            "benchmark": "pdf",
+            "case": os.path.basename(path),
+            "file_mb": round(size_mb, 3),
+            "chars": len(text),
+            "load_ms": ms(seconds),
+            "mb_per_s": round(size_mb / seconds, 3) if seconds else None,
+        }
+
+
+def bench_splitter(args):
+    from indexing import SPLITTER_SETTINGS
+
+    corpus = "\n".join(load_pdf(path) for path in bundled_pdfs(args.uploads_dir)) or "Lorem ipsum. " * 1000
+    # Repeat the bundled text up to --splitter-mb, as separate documents
+    documents = [corpus] * max(1, int(args.splitter_mb * 1e6 / len(corpus)))
+    size_mb = sum(len(document) for document in documents) / 1e6
+    cases = {
+        "chars_1000_200": CharacterTextSplitter(),
+        "indexing": CharacterTextSplitter(**SPLITTER_SETTINGS),
+    }
+    for case, splitter in cases.items():
+        samples, chunks = [], 0
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            chunks = sum(1 for _ in splitter.split_texts(documents))
+            samples.append(time.perf_counter() - start)
+        seconds = statistics.median(samples)
+        yield {
+            "benchmark": "splitter",
+            "case": case,
+            "text_mb": round(size_mb, 3),
+            "chunks": chunks,
+            "split_ms": ms(seconds),
+            "mb_per_s": round(size_mb / seconds, 3),
+        }
+
+
+def clustered_vectors(n: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    # Embeddings of real text cluster by topic; pure noise would flatter recall
+    centers = rng.normal(size=(max(1, n // 100), dim))
+    data = centers[rng.integers(0, centers.shape[0], n)] + 0.6 * rng.normal(size=(n, dim))
+    return data.astype(np.float32)
+
+
+def bench_search(args):
+    rng = np.random.default_rng(0)
+    for n in args.sizes:
+        data = clustered_vectors(n, args.dim, rng)
+        queries = data[rng.integers(0, n, args.queries)] + 0.3 * rng.normal(size=(args.queries, args.dim))
+        # Ground truth by brute force, independent of VectorDatabase
+        unit = data / np.linalg.norm(data, axis=1, keepdims=True)
+        truth = [set(np.argsort(-(unit @ query))[: args.k].tolist()) for query in queries]
+        nlist = max(16, int(np.sqrt(n)))
+        modes = {
+            "matrix": lambda: VectorDatabase(embedding_model=object(), storage="matrix"),
+            # min_train_size above n: train once on everything via build_index
+            "ivf": lambda: VectorDatabase(
+                embedding_model=object(), index=IVFIndex(nlist=nlist, nprobe=8, min_train_size=n + 1)
+            ),
+            "int8_rescore": lambda: VectorDatabase(embedding_model=object(), dtype="int8", rescore=4 * args.k),
+        }
+        if n <= args.dict_max:
+            # The original per-vector loop; too slow to run at every size
+            modes["dict"] = lambda: VectorDatabase(embedding_model=object())
+        for mode, build in modes.items():
+            db = build()
+            start = time.perf_counter()
+            for i, vector in enumerate(data):
+                db.insert(str(i), vector)
+            if db.index is not None:
+                db.build_index()
+            build_s = time.perf_counter() - start
+            samples, found = [], 0
+            for query, want in zip(queries, truth):
+                start = time.perf_counter()
+                hits = db.search(query, args.k)
+                samples.append(time.perf_counter() - start)
+                found += len({int(key) for key, _ in hits} & want)
+            yield {
+                "benchmark": "search",
+                "case": f"{mode}@{n}",
+                "vectors": n,
+                "dim": args.dim,
+                "build_ms": ms(build_s),
+                **percentiles(samples),
+                f"recall@{args.k}": round(found / (args.k * len(queries)), 4),
+            }
+
+
+def bench_api(args):
+    from fastapi.testclient import TestClient
+
+    from fakes import FakeChatModel, FakeEmbeddingModel
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(
+            {
+                "VECTOR_STORE": "local",
+                "VECTOR_STORE_PATH": os.path.join(tmp, "vector_store"),
+                "EMBEDDING_CACHE_PATH": "",
+                "TERM_STATS_PATH": os.path.join(tmp, "term_stats.sqlite3"),
+                # Time the full retrieval and generation path, not replays
+                "ANSWER_CACHE": "0",
+                "WARMUP": "0",
+            }
+        )
+        os.environ.setdefault("OPENAI_API_KEY", "sk-local-stand-in")
+        import app as app_module
+        from resources import Resources
+
+        resources = Resources()
+        resources._embedder = FakeEmbeddingModel(
+            latency_s=args.embed_ms / 1000,
+            cache=resources.embedding_cache,
+            batcher=resources.embedding_batcher,
+        )
+        resources.chat_model = lambda model_name: FakeChatModel(
+            tokens=args.tokens, first_token_s=args.first_token_ms / 1000, token_s=args.token_ms / 1000
+        )
+        app_module.app.dependency_overrides[app_module.get_resources] = lambda: resources
+        results = []
+        with TestClient(app_module.app) as client:
+
+            def upload(path: str) -> tuple:
+                start = time.perf_counter()
+                with open(path, "rb") as f:
+                    job = client.post(
+                        "/api/upload_pdf", files={"file": (os.path.basename(path), f, "application/pdf")}
+                    ).json()
+                while True:
+                    status = client.get(f"/api/jobs/{job['job_id']}").json()
+                    if status["state"] in ("succeeded", "failed"):
+                        break
+                    time.sleep(0.002)
+                if status["state"] == "failed":
+                    raise RuntimeError(status["error"])
+                return time.perf_counter() - start, status["result"]
+
+            for path in bundled_pdfs(args.uploads_dir):
+                filename = os.path.basename(path)
+                upload_s, result = upload(path)
+                reupload_s, _ = upload(path)
+                results.append(
+                    {
+                        "benchmark": "api",
+                        "case": f"upload_pdf:{filename}",
+                        "chunks": result["chunks"],
+                        "upload_ms": ms(upload_s),
+                        "reupload_unchanged_ms": ms(reupload_s),
+                    }
+                )
+                words = [entry["word"] for entry in result["analytics"]] or ["document"]
+                first_byte, total = [], []
+                for i in range(args.chats):
+                    question = f"What does the document say about {words[i % len(words)]}?"
+                    start = time.perf_counter()
+                    with client.stream(
+                        "POST",
+                        "/api/chat",
+                        json={"developer_message": "", "user_message": question, "pdf_filename": filename},
+                    ) as response:
+                        response.raise_for_status()
+                        pieces = response.iter_text()
+                        next(pieces, None)
+                        first_byte.append(time.perf_counter() - start)
+                        for _ in pieces:
+                            pass
+                    total.append(time.perf_counter() - start)
+                first_byte_ms, total_ms = percentiles(first_byte), percentiles(total)
+                results.append(
+                    {
+                        "benchmark": "api",
+                        "case": f"chat:{filename}",
+                        "chats": args.chats,
+                        "first_byte_p50_ms": first_byte_ms["p50_ms"],
+                        "first_byte_p95_ms": first_byte_ms["p95_ms"],
+                        "total_p50_ms": total_ms["p50_ms"],
+                        "total_p95_ms": total_ms["p95_ms"],
+                    }
+                )
+            # On the app's event loop, where the job workers run
+            client.portal.call(resources.aclose)
+        app_module.app.dependency_overrides.clear()
+    yield from results
+
+
+def _direction(metric: str) -> int:
+    """+1 if larger is better, -1 if smaller is better, 0 if not compared."""
+    if metric.endswith("per_s") or metric.startswith("recall"):
+        return 1
+    if metric.endswith("_ms"):
+        return -1
+    return 0
+
+
+def compare(results, baseline, tolerance: float):
+    """Yields a record for every metric that regressed against ``baseline``."""
+    previous = {(r["benchmark"], r["case"]): r for r in baseline["results"]}
+    for result in results:
+        old = previous.get((result["benchmark"], result["case"]))
+        if old is None:
+            continue
+        for metric, value in result.items():
+            direction = _direction(metric)
+            before = old.get(metric)
+            if not direction or not isinstance(value, (int, float)) or not before:
+                continue
+            change = (value - before) / before
+            # Recall is compared in absolute terms; it should barely move
+            limit = 0.01 / before if metric.startswith("recall") else tolerance
+            if direction * change < -limit:
+                yield {
+                    "regression": f"{result['benchmark']}/{result['case']}/{metric}",
+                    "before": before,
+                    "after": value,
+                    "change": round(change, 4),
+                }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", default=",".join(SECTIONS), help="Comma-separated sections to run")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--uploads-dir", default=UPLOADS_DIR)
+    parser.add_argument("--splitter-mb", type=float, default=2.0)
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dict-max", type=int, default=10000, help="Largest size run with dict storage")
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--embed-ms", type=float, default=0.0, help="Simulated embedding round trip")
+    parser.add_argument("--first-token-ms", type=float, default=0.0)
+    parser.add_argument("--token-ms", type=float, default=0.0)
+    parser.add_argument("--output", help="Write results and environment to this JSON file")
+    parser.add_argument("--baseline", help="JSON file from an earlier --output to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    args.sizes = [int(size) for size in args.sizes.split(",")]
+
+    runners = {"splitter": bench_splitter, "pdf": bench_pdf, "search": bench_search, "api": bench_api}
+    results = []
+    for section in args.only.split(","):
+        for result in runners[section](args):
+            print(json.dumps(result), flush=True)
+            results.append(result)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "environment": {
+                        "python": platform.python_version(),
+                        "numpy": np.__version__,
+                        "machine": platform.machine(),
+                        "cpus": os.cpu_count(),
+                    },
+                    "args": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+                    "results": results,
+                },
+                f,
+                indent=1,
+            )
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = list(compare(results, json.load(f), args.tolerance))
+        for regression in regressions:
+            print(json.dumps(regression))
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Upsert and filtered-search latency of the vector-store backends.
+
+Indexes synthetic documents (random 1536-d chunk vectors) through the same
+VectorStore interface /api/upload_pdf and /api/chat use, then times the
+per-PDF searches chat makes. Qdrant runs against QDRANT_URL if set, else its
+local in-memory mode, which has no network round trip and so understates a
+hosted deployment. Prints one JSON object per backend.
+
+    python benchmarks/bench_vector_store.py --documents 50 --chunks 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vector_store import VECTOR_SIZE, LocalStore, Point, QdrantStore
+
+
+def percentile(samples, q: float) -> float:
+    return round(1000 * float(np.percentile(samples, q)), 3)
+
+
+async def measure(name: str, store, args) -> dict:
+    rng = np.random.default_rng(0)
+    await store.prepare()
+    batches = []
+    for doc in range(args.documents):
+        filename = f"bench-{doc}.pdf"
+        points = [
+            Point(
+                id=str(uuid.uuid5(uuid.NAMESPACE_URL, f"{filename}/{i}")),
+                vector=rng.normal(size=VECTOR_SIZE).astype(np.float32).tolist(),
+                payload={"filename": filename, "content_hash": "v1", "chunk": f"chunk {i}", "chunk_index": i},
+            )
+            for i in range(args.chunks)
+        ]
+        batches.extend(points[i : i + args.batch_size] for i in range(0, len(points), args.batch_size))
+
+    start = time.perf_counter()
+    for batch in batches:
+        await store.upsert(batch)
+    upsert_s = time.perf_counter() - start
+    start = time.perf_counter()
+    await store.flush()
+    flush_s = time.perf_counter() - start
+
+    queries = rng.normal(size=(args.queries, VECTOR_SIZE)).astype(np.float32).tolist()
+    filenames = rng.integers(0, args.documents, args.queries)
+    samples = []
+    for query, doc in zip(queries, filenames):
+        start = time.perf_counter()
+        await store.search(query, f"bench-{doc}.pdf", args.limit)
+        samples.append(time.perf_counter() - start)
+    await store.aclose()
+    return {
+        "backend": name,
+        "points": args.documents * args.chunks,
+        "upsert_ms_per_batch": round(1000 * upsert_s / len(batches), 3),
+        "flush_s": round(flush_s, 3),
+        "search_p50_ms": percentile(samples, 50),
+        "search_p95_ms": percentile(samples, 95),
+        "search_mean_ms": round(1000 * statistics.fmean(samples), 3),
+    }
+
+
+async def run(args) -> None:
+    from qdrant_client import AsyncQdrantClient
+
+    url = os.getenv("QDRANT_URL")
+    client = AsyncQdrantClient(url=url, api_key=os.getenv("QDRANT_API_KEY")) if url else AsyncQdrantClient(location=":memory:")
+    collection_name = f"bench_{uuid.uuid4().hex[:8]}"
+    try:
+        result = await measure("qdrant" if url else "qdrant:memory", QdrantStore(client, collection_name), args)
+        print(json.dumps(result))
+    finally:
+        await client.delete_collection(collection_name)
+        await client.close()
+
+    with tempfile.TemporaryDirectory() as path:
+        print(json.dumps(await measure("local", LocalStore(path, embedding_model=object()), args)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=50)
+    parser.add_argument("--chunks", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Deterministic offline stand-ins for the OpenAI-backed models.
+
+``FakeEmbeddingModel`` and ``FakeChatModel`` subclass the real classes and
+replace only the API calls, so caching, batching and streaming code still
+runs. Embeddings are sums of per-word pseudo-random vectors: the same text
+always gets the same vector, and texts sharing words are similar.
+"""
+import asyncio
+import re
+import time
+import zlib
+from typing import Dict, List
+
+import numpy as np
+
+from aimakerspace.openai_utils.chatmodel import ChatOpenAI
+from aimakerspace.openai_utils.embedding import EmbeddingModel
+
+_WORD = re.compile(r"\w+")
+
+
+class FakeEmbeddingModel(EmbeddingModel):
+    def __init__(self, dim: int = 1536, latency_s: float = 0.0, **kwargs):
+        """
+        :param latency_s: Simulated round trip per API request.
+        Other arguments (``cache``, ``batcher``) go to :class:`EmbeddingModel`.
+        """
+        super().__init__(**kwargs)
+        self.dim = dim
+        self.latency_s = latency_s
+        self.requests = 0
+        self._words: Dict[str, np.ndarray] = {}
+
+    def _word_vector(self, word: str) -> np.ndarray:
+        vector = self._words.get(word)
+        if vector is None:
+            rng = np.random.default_rng(zlib.crc32(word.encode("utf-8")))
+            vector = self._words[word] = rng.standard_normal(self.dim).astype(np.float32)
+        return vector
+
+    def embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in _WORD.findall(text.lower()):
+            vector += self._word_vector(word)
+        norm = float(np.linalg.norm(vector))
+        if not norm:
+            vector[0], norm = 1.0, 1.0
+        return (vector / norm).tolist()
+
+    async def _async_embed_batch(self, list_of_text: List[str]) -> List[List[float]]:
+        self.requests += 1
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        return [self.embed(text) for text in list_of_text]
+
+    def _embed_batch(self, list_of_text: List[str]) -> List[List[float]]:
+        self.requests += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return [self.embed(text) for text in list_of_text]
+
+
+class FakeChatModel(ChatOpenAI):
+    """Answers with ``tokens`` words, ``first_token_s`` then ``token_s`` apart."""
+
+    def __init__(self, tokens: int = 50, first_token_s: float = 0.0, token_s: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.tokens = tokens
+        self.first_token_s = first_token_s
+        self.token_s = token_s
+
+    def _answer(self, messages) -> List[str]:
+        words = _WORD.findall(messages[-1]["content"]) or ["answer"]
+        return [words[i % len(words)] + " " for i in range(self.tokens)]
+
+    def run(self, messages, text_only: bool = True, **kwargs):
+        if not isinstance(messages, list):
+            raise ValueError("messages must be a list")
+        time.sleep(self.first_token_s + self.tokens * self.token_s)
+        return "".join(self._answer(messages))
+
+    async def astream(self, messages, **kwargs):
+        if not isinstance(messages, list):
+            raise ValueError("messages must be a list")
+        await asyncio.sleep(self.first_token_s)
+        for i, token in enumerate(self._answer(messages)):
+            if i and self.token_s:
+                await asyncio.sleep(self.token_s)
+            yield token
@@ -0,0 +1,324 @@
+# Incremental PDF indexing into the vector store (see vector_store.py).
+#
+# Every chunk gets a deterministic point ID derived from the file name, the
+# file's content hash and the chunk index. Re-uploading an unchanged file is
+# therefore a no-op, and a changed file upserts its new chunks and then
+# deletes the points left over from its previous version. The document
+# catalog gets one record per file once its current version is stored.
+import asyncio
+import hashlib
+import time
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, BinaryIO, Callable, Dict, List, Optional
+
+from aimakerspace.pipeline import IngestionPipeline
+from aimakerspace.term_stats import count_terms
+from aimakerspace.text_utils import CharacterTextSplitter, count_pdf_pages, iter_pdf_pages
+from metrics import UPLOAD_CHUNKS, UPLOAD_STAGE_SECONDS, UPLOADS, Spans
+from resources import Resources
+from vector_store import Point, document_record
+
+# Namespace for uuid5 point IDs; changing it re-indexes every document
+POINT_NAMESPACE = uuid.UUID("6f1c2b1e-5d0a-4c8e-9a57-3f2e7c1d9b40")
+
+# Sentence-aware chunks budgeted in embedding tokens. These settings are
+# hashed into each document's version, so changing them re-chunks a file on
+# its next upload instead of treating it as unchanged
+SPLITTER_SETTINGS = {
+    "chunk_size": 128,
+    "chunk_overlap": 24,
+    "boundaries": True,
+    "unit": "tokens",
+    "model_name": "text-embedding-3-small",
+}
+
+# filename -> [lock, holders and waiters]. Indexing or deleting a filename
+# holds its lock: two uploads of one name would otherwise each count the
+# versions stored before the other's upsert, then delete the other's points
+_document_locks: Dict[str, List] = {}
+
+# filename -> times its lock was released; a change means the document was
+# indexed or deleted in between
+_lock_releases: Counter = Counter()
+
+
+@asynccontextmanager
+async def document_lock(filename: str) -> AsyncIterator[None]:
+    entry = _document_locks.setdefault(filename, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        _lock_releases[filename] += 1
+        entry[1] -= 1
+        if not entry[1]:
+            del _document_locks[filename]
+
+# Called with (stage name, chunks indexed so far), e.g. by a background job
+Progress = Callable[[str, int], None]
+
+
+def _no_progress(stage: str, chunks: int) -> None:
+    pass
+
+
+def splitter_salt() -> str:
+    """The chunking settings hashed into every document version.
+
+    Includes the tokenizer the splitter counts with: without tiktoken's
+    encoding it estimates tokens from length and cuts different chunks, and
+    those must not share a version with chunks cut by the real encoding.
+    Loads the encoding, so call it from a worker thread.
+    """
+    from aimakerspace.openai_utils.tokenizer import tokenizer_name
+
+    settings = {**SPLITTER_SETTINGS, "tokenizer": tokenizer_name(SPLITTER_SETTINGS["model_name"])}
+    return repr(sorted(settings.items()))
+
+
+def file_sha256(file: BinaryIO, salt: str = "") -> str:
+    """Hashes ``salt`` and a binary file object in blocks, then rewinds it."""
+    digest = hashlib.sha256(salt.encode("utf-8"))
+    file.seek(0)
+    for block in iter(lambda: file.read(1 << 20), b""):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def point_id(filename: str, content_hash: str, chunk_index: int) -> str:
+    return str(uuid.uuid5(POINT_NAMESPACE, f"{filename}\0{content_hash}\0{chunk_index}"))
+
+
+async def index_pdf(
+    resources: Resources,
+    filename: str,
+    file: BinaryIO,
+    progress: Optional[Progress] = None,
+) -> dict:
+    """Indexes one uploaded PDF and returns its status, analytics, stats and
+    per-stage timings (also recorded for /api/metrics). Uploads of the same
+    filename are indexed one at a time."""
+    async with document_lock(filename):
+        timings = Spans("upload", UPLOAD_STAGE_SECONDS)
+        try:
+            result = await _index_pdf(resources, filename, file, progress or _no_progress, timings)
+        except BaseException:
+            UPLOADS.inc(status="failed")
+            timings.finish(filename=filename, status="failed")
+            raise
+    UPLOADS.inc(status=result["status"])
+    if result["status"] == "indexed":
+        UPLOAD_CHUNKS.inc(result["chunks"])
+    timings.finish(filename=filename, status=result["status"], chunks=result["chunks"])
+    result["timings"] = timings.as_dict()
+    return result
+
+
+async def _index_pdf(resources: Resources, filename: str, file: BinaryIO, progress: Progress, timings: Spans) -> dict:
+    from aimakerspace.lexical import BM25Index
+
+    store = resources.vector_store
+    progress("preparing", 0)
+    await store.prepare()
+    with timings.span("hash"):
+        content_hash = await asyncio.to_thread(lambda: file_sha256(file, splitter_salt()))
+    existing, stale = await store.count_versions(filename, content_hash)
+    unchanged = existing > 0 and stale == 0
+
+    # Word counts are gathered page by page as the text streams past and
+    # stored once per document version (see TermStats)
+    word_counts = Counter()
+    page_count = 0
+
+    def pages():
+        # Runs in a worker thread; the time between pages is the splitter's
+        nonlocal page_count
+        extracted = iter_pdf_pages(file)
+        while True:
+            start = time.perf_counter()
+            page = next(extracted, None)
+            counted = time.perf_counter()
+            timings.add("extraction", counted - start)
+            if page is None:
+                break
+            page_count += 1
+            word_counts.update(count_terms(page))
+            timings.add("analytics", time.perf_counter() - counted)
+            yield page
+
+    stats = resources.term_stats
+    if unchanged:
+        # Same file, same content: the index is already up to date. Only
+        # re-read the PDF if its term counts were lost (e.g. /tmp wiped)
+        progress("analytics", existing)
+        if await asyncio.to_thread(stats.content_hash, filename) != content_hash:
+            await asyncio.to_thread(lambda: sum(1 for _ in pages()))
+            with timings.span("analytics"):
+                await asyncio.to_thread(stats.put, filename, content_hash, word_counts)
+        ingestion = None
+        chunk_count = existing
+        # Likewise restore a lost record, or complete a backfilled one
+        entry = await store.get_record(filename)
+        if entry is None or entry["content_hash"] != content_hash or entry["pages"] is None:
+            if not page_count:
+                page_count = await asyncio.to_thread(count_pdf_pages, file)
+            await store.put_record(document_record(filename, content_hash, chunk_count, page_count))
+            await store.flush()
+        else:
+            page_count = entry["pages"]
+    else:
+        splitter = CharacterTextSplitter(**SPLITTER_SETTINGS)
+        # BM25 postings for hybrid chat retrieval, built as chunks stream past
+        lexical = BM25Index()
+        # Chunk offsets into the document's text (its pages joined), kept
+        # until the chunk's batch is upserted
+        offsets = {}
+
+        def chunks():
+            i = 0
+            for start, end, chunk in splitter.split_stream_spans(pages()):
+                if len(chunk) > 4000:  # Safety net
+                    continue
+                offsets[i] = (start, end)
+                i += 1
+                yield chunk
+
+        indexed = 0
+        progress("indexing", indexed)
+
+        # Upsert each embedded batch to the store as soon as it is ready
+        async def upsert(start, batch, embeddings):
+            nonlocal indexed
+            points = []
+            for i, (embedding, chunk) in enumerate(zip(embeddings, batch), start):
+                chunk_start, chunk_end = offsets.pop(i)
+                points.append(
+                    Point(
+                        id=point_id(filename, content_hash, i),
+                        vector=embedding,
+                        payload={
+                            "filename": filename,
+                            "content_hash": content_hash,
+                            "chunk": chunk,
+                            "chunk_index": i,
+                            "start": chunk_start,
+                            "end": chunk_end,
+                        },
+                    )
+                )
+            with timings.span("upsert"):
+                await store.upsert(points)
+            for point, chunk in zip(points, batch):
+                lexical.add(point.id, chunk)
+            indexed += len(points)
+            progress("indexing", indexed)
+
+        pipeline = IngestionPipeline(resources.embedder, batch_size=resources.ingest_batch_size)
+        try:
+            ingestion = await pipeline.run(chunks(), upsert)
+        except BaseException:
+            resources.lexical_indexes.discard(filename)
+            # Drop a half-written version so a retry is not mistaken for a no-op
+            await store.delete_versions(filename, content_hash, keep=False)
+            raise
+        # The chunk stage's busy time is page extraction, term counting and
+        # splitting; the first two are timed inside pages()
+        chunking_s = ingestion["chunk"]["busy_s"]
+        timings.add("splitting", max(0.0, chunking_s - timings.durations.get("extraction", 0.0) - timings.durations.get("analytics", 0.0)))
+        timings.add("embedding", ingestion["embed"]["busy_s"])
+        # The new version is complete; remove chunks of the previous one
+        progress("cleanup", indexed)
+        with timings.span("cleanup"):
+            await store.delete_versions(filename, content_hash, keep=True)
+            await store.flush()
+        resources.lexical_indexes.put(filename, content_hash, lexical)
+        # Cached answers were grounded in the previous version
+        resources.answer_cache.invalidate(lambda partition: partition[0] == filename)
+        with timings.span("analytics"):
+            await asyncio.to_thread(stats.put, filename, content_hash, word_counts)
+        chunk_count = ingestion["total"]["items"]
+        await store.put_record(document_record(filename, content_hash, chunk_count, page_count))
+        await store.flush()
+    with timings.span("analytics"):
+        top_words = await asyncio.to_thread(stats.top_terms, 20, filename)
+    analytics = [{"word": w, "count": c} for w, c in top_words]
+    return {
+        "status": "unchanged" if unchanged else "indexed",
+        "content_hash": content_hash,
+        "chunks": chunk_count,
+        "pages": page_count,
+        "analytics": analytics,
+        "ingestion": ingestion,
+    }
+
+
+async def delete_pdf(resources: Resources, filename: str) -> int:
+    """Removes a document's chunks, catalog record, term counts, BM25 index
+    and cached answers; returns how many chunks were deleted. Waits for an
+    upload of the same filename that is being indexed."""
+    async with document_lock(filename):
+        deleted = await resources.vector_store.delete_document(filename)
+        await resources.vector_store.remove_record(filename)
+        await resources.vector_store.flush()
+        await asyncio.to_thread(resources.term_stats.remove, filename)
+        resources.lexical_indexes.discard(filename)
+        resources.answer_cache.invalidate(lambda partition: partition[0] == filename)
+    return deleted
+
+
+async def backfill_catalog(resources: Resources, progress: Optional[Progress] = None) -> int:
+    """Adds catalog records for documents stored before the catalog lived in
+    the vector store; returns how many were added.
+
+    Scans every point, so it only runs when the store reports
+    ``needs_backfill`` and is meant for a background job, never a request.
+    Page counts stay unknown until the PDF is uploaded again.
+    """
+    store = resources.vector_store
+    await store.prepare()
+    if not store.needs_backfill:
+        return 0
+    progress = progress or _no_progress
+    progress("scanning", 0)
+    # The largest version of a document mid re-index is its complete one
+    versions = {}
+    for filename, content_hash, chunks in await store.document_versions():
+        if chunks > versions.get(filename, ("", 0))[1]:
+            versions[filename] = (content_hash, chunks)
+    added = 0
+    for filename, (content_hash, chunks) in sorted(versions.items()):
+        async with document_lock(filename):
+            # Indexed, replaced or deleted here since the scan: nothing to add
+            if await store.get_record(filename) is not None:
+                continue
+            if (await store.count_versions(filename, content_hash))[0] == 0:
+                continue
+            await store.put_record(document_record(filename, content_hash, chunks, None))
+        added += 1
+        progress("backfilling", added)
+    await store.flush()
+    store.needs_backfill = False
+    return added
+
+
+async def prune_term_stats(resources: Resources) -> None:
+    """Drops word counts of versions the catalog no longer lists.
+
+    Counts are kept per instance, so another instance's re-index or delete
+    leaves them stale here. Documents indexed or deleted here while the
+    records are read are skipped: their counts may be newer than the read.
+    """
+    releases = dict(_lock_releases)
+    records = await resources.vector_store.records()
+    busy = set(_document_locks) | {
+        filename for filename, count in _lock_releases.items() if releases.get(filename) != count
+    }
+    await asyncio.to_thread(
+        resources.term_stats.retain,
+        [(record["filename"], record["content_hash"]) for record in records],
+        busy,
+    )
@@ -0,0 +1,130 @@
+# In-process background job queue for slow work such as PDF indexing.
+#
+# Jobs wait in a FIFO queue served by a fixed number of asyncio workers, so
+# however many uploads arrive at once only ``workers`` of them are indexed
+# concurrently, in arrival order, and the event loop stays free for /api/chat.
+# State lives in memory: jobs are lost on restart and are only visible to the
+# process that accepted them.
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class Job:
+    """Progress and outcome of one queued job."""
+
+    def __init__(self, kind: str, name: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.name = name
+        self.state = QUEUED
+        self.stage = QUEUED
+        self.chunks = 0
+        self.error: Optional[str] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.state in (SUCCEEDED, FAILED)
+
+    def progress(self, stage: str, chunks: int) -> None:
+        """Progress callback handed to the job's work function."""
+        self.stage = stage
+        self.chunks = chunks
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "name": self.name,
+            "state": self.state,
+            "stage": self.stage,
+            "chunks": self.chunks,
+            "error": self.error,
+            "result": self.result,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+# Called with the job (for progress reporting); returns the job's result
+Work = Callable[[Job], Awaitable[Dict[str, Any]]]
+
+
+class JobQueue:
+    """FIFO job queue drained by a bounded pool of asyncio workers.
+
+    Workers start on the first :meth:`submit`, so the queue works even where
+    lifespan events are skipped. Finished jobs are kept for lookup until more
+    than ``max_finished`` have accumulated, oldest first out.
+    """
+
+    def __init__(self, workers: int = 2, max_finished: int = 1000):
+        self.workers = workers
+        self.max_finished = max_finished
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def _start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def _worker(self) -> None:
+        while True:
+            job, work = await self._queue.get()
+            job.state = job.stage = RUNNING
+            job.started_at = time.time()
+            try:
+                job.result = await work(job)
+                job.state = job.stage = SUCCEEDED
+            except Exception as e:
+                job.state = FAILED
+                job.error = str(e)
+            finally:
+                job.finished_at = time.time()
+                self._queue.task_done()
+                self._forget_old()
+
+    def _forget_old(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[: max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def submit(self, kind: str, name: str, work: Work) -> Job:
+        """Queues ``work`` and returns its job right away."""
+        if self._queue is None:
+            self._start()
+        job = Job(kind, name)
+        self._jobs[job.id] = job
+        self._queue.put_nowait((job, work))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def pending(self) -> int:
+        return sum(1 for job in self._jobs.values() if not job.done)
+
+    async def join(self) -> None:
+        """Waits until every submitted job has finished."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def aclose(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
@@ -0,0 +1,216 @@
+# Latency histograms and counters for /api/metrics (Prometheus text format).
+#
+# A small in-process registry instead of prometheus_client: an observation is
+# one bisect and two additions under a lock, and nothing is imported that
+# the cold start would pay for. Requests time their stages with Spans, which
+# feeds a stage-labelled histogram and logs one structured line per request.
+import json
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds; wide enough for a cached chat (ms) and a large PDF upload (minutes)
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0,
+)
+RATE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Exposition lines, one per label set (and bucket)."""
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return header + "".join(line + "\n" for line in self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in values]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (per-bucket counts with a final +Inf bucket, sum)
+        self._series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+        lines = []
+        for key, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                labels = _labels(self.labelnames, key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric '{metric.name}' is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets=buckets))
+
+    def render(self) -> str:
+        return "".join(metric.render() for metric in self._metrics.values())
+
+
+REGISTRY = Registry()
+
+CHAT_STAGE_SECONDS = REGISTRY.histogram(
+    "chat_stage_seconds",
+    "Time spent in each /api/chat stage: embed, cache_lookup, search, pack, first_token (from request start) and total.",
+    ["stage"],
+)
+CHAT_TOKENS_PER_SECOND = REGISTRY.histogram(
+    "chat_tokens_per_second",
+    "Streamed chat tokens per second after the first token.",
+    buckets=RATE_BUCKETS,
+)
+CHAT_TOKENS = REGISTRY.counter("chat_tokens_total", "Chat tokens streamed to clients.")
+CHAT_REQUESTS = REGISTRY.counter(
+    "chat_requests_total",
+    "Chat requests by outcome: generated, cache_hit, cancelled, timeout or error.",
+    ["outcome"],
+)
+UPLOAD_STAGE_SECONDS = REGISTRY.histogram(
+    "upload_stage_seconds",
+    "Busy time of each PDF indexing stage: hash, extraction, splitting, embedding, upsert, cleanup, "
+    "analytics and total. Extraction, embedding and upsert overlap, so they can add up to more than total.",
+    ["stage"],
+)
+UPLOADS = REGISTRY.counter("uploads_total", "Indexed uploads by status: indexed, unchanged or failed.", ["status"])
+UPLOAD_CHUNKS = REGISTRY.counter("upload_chunks_total", "Chunks embedded and stored by uploads.")
+
+
+class Spans:
+    """Named stage durations of one request.
+
+    Time a stage with ``with spans.span("search"):`` or add a measured
+    duration with :meth:`add` (repeated stages accumulate). :meth:`finish`
+    observes every stage into ``histogram`` and logs them as one JSON line.
+    """
+
+    def __init__(self, event: str, histogram: Histogram):
+        self.event = event
+        self.histogram = histogram
+        self.started = time.perf_counter()
+        self.durations: Dict[str, float] = {}
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.durations[stage] = self.durations.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {stage: round(seconds, 6) for stage, seconds in self.durations.items()}
+
+    def finish(self, **fields) -> None:
+        self.durations.setdefault("total", self.elapsed())
+        for stage, seconds in self.durations.items():
+            self.histogram.observe(seconds, stage=stage)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({"event": self.event, "seconds": self.as_dict(), **fields}))
+
+    def server_timing(self) -> str:
+        """The stages so far as a ``Server-Timing`` header value (in ms)."""
+        return ", ".join(f"{stage};dur={1000 * seconds:.1f}" for stage, seconds in self.durations.items())
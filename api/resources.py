@@ -0,0 +1,289 @@
+# Application-lifetime registry of the clients the API endpoints share.
+# Building an OpenAI or Qdrant client per request means a fresh connection
+# pool (and TLS handshake) per request; these live for the whole process.
+#
+# The SDK imports live inside the properties: importing openai, httpx and
+# qdrant_client costs over a second, which serverless cold starts should not
+# pay before the first request that needs them.
+import logging
+import os
+import threading
+from typing import TYPE_CHECKING, Optional
+
+from aimakerspace.openai_utils.embedding_cache import EmbeddingCache
+from aimakerspace.term_stats import TermStats
+from jobs import JobQueue
+from retrieval import LexicalIndexes
+
+logger = logging.getLogger(__name__)
+
+# Model a chat request uses unless it names another
+DEFAULT_CHAT_MODEL = "gpt-4.1-mini"
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
+    from qdrant_client import AsyncQdrantClient, QdrantClient
+    from aimakerspace.openai_utils.batching import EmbeddingBatcher
+    from aimakerspace.openai_utils.chatmodel import ChatOpenAI
+    from aimakerspace.openai_utils.embedding import EmbeddingModel
+    from aimakerspace.semantic_cache import SemanticCache
+    from vector_store import VectorStore
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+class Resources:
+    """Lazily built, shared clients for OpenAI and Qdrant.
+
+    Each client is created on first use and then reused, keeping its HTTP
+    keep-alive pool warm. Pool sizes and timeouts come from the environment
+    (see the README). Call :meth:`aclose` on shutdown.
+    """
+
+    def __init__(self):
+        self.openai_timeout = _env_float("OPENAI_TIMEOUT", 60.0)
+        self.openai_connect_timeout = _env_float("OPENAI_CONNECT_TIMEOUT", 5.0)
+        self.openai_max_connections = _env_int("OPENAI_MAX_CONNECTIONS", 100)
+        self.openai_max_keepalive = _env_int("OPENAI_MAX_KEEPALIVE", 20)
+        # Retries are ours (jittered backoff, see resilience.py), not the SDK's
+        self.openai_retries = _env_int("OPENAI_RETRIES", 3)
+        # Per-stage deadlines of a chat, in seconds
+        self.embed_timeout = _env_float("EMBED_TIMEOUT", 10.0)
+        self.search_timeout = _env_float("SEARCH_TIMEOUT", 10.0)
+        self.chat_first_token_timeout = _env_float("CHAT_FIRST_TOKEN_TIMEOUT", 20.0)
+        self.chat_idle_timeout = _env_float("CHAT_IDLE_TIMEOUT", 30.0)
+        # A slow query embedding gets a duplicate request after the recent p95
+        self.embed_hedge = os.getenv("EMBED_HEDGE", "0") == "1"
+        self.embed_hedge_min_ms = _env_float("EMBED_HEDGE_MIN_MS", 100.0)
+        self.qdrant_url = os.getenv("QDRANT_URL")
+        self.qdrant_api_key = os.getenv("QDRANT_API_KEY")
+        self.qdrant_timeout = _env_int("QDRANT_TIMEOUT", 10)
+        self.qdrant_pool_size = _env_int("QDRANT_POOL_SIZE", 20)
+        self.collection_name = os.getenv("QDRANT_COLLECTION", "pdf_vectors")
+        # Where chunk vectors live: "qdrant", or "local" for an in-process
+        # VectorDatabase saved under VECTOR_STORE_PATH (see vector_store.py)
+        self.vector_store_backend = os.getenv("VECTOR_STORE", "qdrant")
+        if self.vector_store_backend not in ("qdrant", "local"):
+            raise ValueError("VECTOR_STORE must be 'qdrant' or 'local'")
+        self.vector_store_path = os.getenv("VECTOR_STORE_PATH", "/tmp/vector_store") or None
+        self.embedding_concurrency = _env_int("EMBEDDING_CONCURRENCY", 4)
+        self.ingest_batch_size = _env_int("INGEST_BATCH_SIZE", 64)
+        # Concurrent chat query embeddings merged into one API request
+        self.embedding_coalesce = os.getenv("EMBEDDING_COALESCE", "1") == "1"
+        self.embedding_coalesce_ms = _env_float("EMBEDDING_COALESCE_MS", 2.0)
+        self.embedding_coalesce_max = _env_int("EMBEDDING_COALESCE_MAX", 64)
+        # Chat retrieval: dense candidates per query, fused with BM25 hits
+        self.retrieval_candidates = _env_int("RETRIEVAL_CANDIDATES", 20)
+        self.hybrid_search = os.getenv("HYBRID_SEARCH", "1") == "1"
+        # Chat prompt context: chunks retrieved, then merged and packed into
+        # at most this many tokens
+        self.context_chunks = _env_int("CONTEXT_CHUNKS", 6)
+        self.context_max_tokens = _env_int("CONTEXT_MAX_TOKENS", 512)
+        self.lexical_indexes = LexicalIndexes(max_documents=_env_int("LEXICAL_CACHE_DOCUMENTS", 32))
+        # Answers replayed for near-duplicate questions about the same PDF
+        self.answer_cache_enabled = os.getenv("ANSWER_CACHE", "1") == "1"
+        self.answer_cache_threshold = _env_float("ANSWER_CACHE_THRESHOLD", 0.95)
+        self.answer_cache_ttl = _env_float("ANSWER_CACHE_TTL", 3600.0)
+        self.answer_cache_entries = _env_int("ANSWER_CACHE_ENTRIES", 1000)
+        # Uploads are indexed in the background by this many workers at most
+        self.jobs = JobQueue(workers=_env_int("INGEST_WORKERS", 2))
+        self._openai: Optional["OpenAI"] = None
+        self._async_openai: Optional["AsyncOpenAI"] = None
+        self._qdrant: Optional["QdrantClient"] = None
+        self._async_qdrant: Optional["AsyncQdrantClient"] = None
+        self._embedding_batcher: Optional["EmbeddingBatcher"] = None
+        self._embedder: Optional["EmbeddingModel"] = None
+        self._answer_cache: Optional["SemanticCache"] = None
+        self._vector_store: Optional["VectorStore"] = None
+        self._lock = threading.RLock()
+        # Shared embedding cache so repeated questions and re-uploaded PDFs
+        # skip the API. The SQLite tier lives in /tmp for serverless (Vercel)
+        self.embedding_cache = EmbeddingCache(
+            max_bytes=_env_int("EMBEDDING_CACHE_MB", 64) * 1024 * 1024,
+            path=os.getenv("EMBEDDING_CACHE_PATH", "/tmp/embedding_cache.sqlite3") or None,
+        )
+        # Per-document word counts behind the upload and /api/analytics charts
+        self.term_stats = TermStats(path=os.getenv("TERM_STATS_PATH", "/tmp/term_stats.sqlite3") or None)
+
+    def _httpx_options(self) -> dict:
+        import httpx
+
+        return {
+            "timeout": httpx.Timeout(self.openai_timeout, connect=self.openai_connect_timeout),
+            "limits": httpx.Limits(
+                max_connections=self.openai_max_connections,
+                max_keepalive_connections=self.openai_max_keepalive,
+            ),
+        }
+
+    def _lazy(self, attr: str, build):
+        # Double-checked so the warm-up thread and a request never both build
+        value = getattr(self, attr)
+        if value is None:
+            with self._lock:
+                value = getattr(self, attr)
+                if value is None:
+                    value = build()
+                    setattr(self, attr, value)
+        return value
+
+    def _build_openai(self) -> "OpenAI":
+        import httpx
+        from openai import OpenAI
+
+        return OpenAI(http_client=httpx.Client(**self._httpx_options()), max_retries=0)
+
+    def _build_async_openai(self) -> "AsyncOpenAI":
+        import httpx
+        from openai import AsyncOpenAI
+
+        return AsyncOpenAI(http_client=httpx.AsyncClient(**self._httpx_options()), max_retries=0)
+
+    def _qdrant_options(self) -> dict:
+        return {
+            "url": self.qdrant_url,
+            "api_key": self.qdrant_api_key,
+            "timeout": self.qdrant_timeout,
+            "pool_size": self.qdrant_pool_size,
+            # The version check is a network round trip at construction time
+            "check_compatibility": False,
+        }
+
+    def _build_qdrant(self) -> "QdrantClient":
+        from qdrant_client import QdrantClient
+
+        return QdrantClient(**self._qdrant_options())
+
+    def _build_async_qdrant(self) -> "AsyncQdrantClient":
+        from qdrant_client import AsyncQdrantClient
+
+        return AsyncQdrantClient(**self._qdrant_options())
+
+    def _build_embedding_batcher(self) -> "EmbeddingBatcher":
+        from aimakerspace.openai_utils.batching import EmbeddingBatcher
+
+        # Splits large chunk lists into API-sized batches embedded concurrently
+        return EmbeddingBatcher(max_concurrency=self.embedding_concurrency, max_retries=self.openai_retries)
+
+    def _build_embedder(self) -> "EmbeddingModel":
+        from aimakerspace.openai_utils.embedding import EmbeddingModel
+        from aimakerspace.openai_utils.resilience import Hedger
+
+        return EmbeddingModel(
+            cache=self.embedding_cache,
+            batcher=self.embedding_batcher,
+            client=self.openai,
+            async_client=self.async_openai,
+            coalesce_window_s=self.embedding_coalesce_ms / 1000 if self.embedding_coalesce else None,
+            coalesce_max_inputs=self.embedding_coalesce_max,
+            query_timeout_s=self.embed_timeout,
+            hedger=Hedger(min_delay_s=self.embed_hedge_min_ms / 1000) if self.embed_hedge else None,
+        )
+
+    def _build_answer_cache(self) -> "SemanticCache":
+        from aimakerspace.semantic_cache import SemanticCache
+
+        return SemanticCache(
+            embedding_model=self.embedder,
+            threshold=self.answer_cache_threshold,
+            ttl_s=self.answer_cache_ttl,
+            max_entries=self.answer_cache_entries,
+        )
+
+    def _build_vector_store(self) -> "VectorStore":
+        from vector_store import LocalStore, QdrantStore
+
+        if self.vector_store_backend == "local":
+            return LocalStore(self.vector_store_path, embedding_model=self.embedder)
+        return QdrantStore(self.async_qdrant, self.collection_name)
+
+    @property
+    def openai(self) -> "OpenAI":
+        return self._lazy("_openai", self._build_openai)
+
+    @property
+    def async_openai(self) -> "AsyncOpenAI":
+        return self._lazy("_async_openai", self._build_async_openai)
+
+    @property
+    def qdrant(self) -> "QdrantClient":
+        return self._lazy("_qdrant", self._build_qdrant)
+
+    @property
+    def async_qdrant(self) -> "AsyncQdrantClient":
+        return self._lazy("_async_qdrant", self._build_async_qdrant)
+
+    @property
+    def embedding_batcher(self) -> "EmbeddingBatcher":
+        return self._lazy("_embedding_batcher", self._build_embedding_batcher)
+
+    @property
+    def embedder(self) -> "EmbeddingModel":
+        return self._lazy("_embedder", self._build_embedder)
+
+    @property
+    def vector_store(self) -> "VectorStore":
+        return self._lazy("_vector_store", self._build_vector_store)
+
+    @property
+    def answer_cache(self) -> "SemanticCache":
+        return self._lazy("_answer_cache", self._build_answer_cache)
+
+    def chat_model(self, model_name: str) -> "ChatOpenAI":
+        from aimakerspace.openai_utils.chatmodel import ChatOpenAI
+        from aimakerspace.openai_utils.resilience import RetryPolicy
+
+        # ChatOpenAI is a thin wrapper; the pooled clients are what get reused
+        return ChatOpenAI(
+            model_name=model_name,
+            client=self.openai,
+            async_client=self.async_openai,
+            retry=RetryPolicy(max_retries=self.openai_retries),
+            timeout_s=self.openai_timeout,
+            first_token_timeout_s=self.chat_first_token_timeout,
+            idle_timeout_s=self.chat_idle_timeout,
+        )
+
+    def warm_up(self) -> None:
+        """Imports the heavy SDKs and builds the shared clients.
+
+        Meant to run in a worker thread right after startup so the first
+        chat or upload does not pay for it. The only network calls download
+        the tiktoken encodings of the embedding and default chat models.
+        """
+        try:
+            import PyPDF2  # noqa: F401
+            from qdrant_client.http import models  # noqa: F401
+            from aimakerspace.openai_utils.tokenizer import get_encoding
+
+            self.embedder
+            for model_name in (self.embedder.embeddings_model_name, DEFAULT_CHAT_MODEL):
+                get_encoding(model_name)
+            if self.vector_store_backend == "qdrant":
+                self.async_qdrant
+                self.qdrant
+            self.vector_store
+        except Exception as e:
+            # Warm-up is an optimization; the request path builds lazily anyway
+            logger.warning("Warm-up failed: %s", e)
+
+    async def aclose(self) -> None:
+        await self.jobs.aclose()
+        if self._vector_store is not None:
+            await self._vector_store.aclose()
+        if self._async_openai is not None:
+            await self._async_openai.close()
+        if self._openai is not None:
+            self._openai.close()
+        if self._async_qdrant is not None:
+            await self._async_qdrant.close()
+        if self._qdrant is not None:
+            self._qdrant.close()
+        self.embedding_cache.close()
+        self.term_stats.close()
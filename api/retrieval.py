@@ -0,0 +1,111 @@
+# Hybrid (vector + BM25) retrieval of chunks for /api/chat.
+#
+# The vector store serves the dense side. The lexical side is an in-process
+# BM25 index per PDF version, keyed by point ID: it is built while the PDF is
+# indexed, or on first use from the chunk payloads already in the store
+# (e.g. after a restart, or in another worker process). A cached index of
+# another version than the dense hits (the PDF was re-indexed elsewhere) is
+# rebuilt. The two rankings are merged by
+# reciprocal rank fusion, so exact terms such as bill numbers or names that
+# embeddings blur still surface.
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from aimakerspace.lexical import BM25Index
+    from resources import Resources
+
+
+class LexicalIndexes:
+    """Per-document BM25 indexes with the version each was built from,
+    least recently used evicted first."""
+
+    def __init__(self, max_documents: int = 32):
+        self.max_documents = max_documents
+        self._indexes: "OrderedDict[str, Tuple[Optional[str], BM25Index]]" = OrderedDict()
+        # Bumped by every put and discard of a filename, so a build that
+        # started before one of them can tell it is out of date
+        self._generations: Dict[str, int] = {}
+
+    def get(self, filename: str, content_hash: Optional[str]) -> Optional["BM25Index"]:
+        """The index of ``filename`` if it was built from ``content_hash``."""
+        entry = self._indexes.get(filename)
+        if entry is None or entry[0] != content_hash:
+            return None
+        self._indexes.move_to_end(filename)
+        return entry[1]
+
+    def generation(self, filename: str) -> int:
+        return self._generations.get(filename, 0)
+
+    def put(
+        self,
+        filename: str,
+        content_hash: Optional[str],
+        index: "BM25Index",
+        generation: Optional[int] = None,
+    ) -> bool:
+        """Stores ``index``, unless ``generation`` is given and another put
+        or discard of ``filename`` happened since it was read."""
+        if generation is not None and generation != self.generation(filename):
+            return False
+        self._generations[filename] = self.generation(filename) + 1
+        self._indexes[filename] = (content_hash, index)
+        self._indexes.move_to_end(filename)
+        while len(self._indexes) > self.max_documents:
+            self._indexes.popitem(last=False)
+        return True
+
+    def discard(self, filename: str) -> None:
+        self._generations[filename] = self.generation(filename) + 1
+        self._indexes.pop(filename, None)
+
+
+async def lexical_index(resources: "Resources", filename: str, content_hash: Optional[str]) -> "BM25Index":
+    """The BM25 index of ``filename`` at ``content_hash``, built from its
+    stored chunks if needed.
+
+    A build that an upload or delete of the file overtook is returned but
+    not cached, since the store may have changed under it.
+    """
+    from aimakerspace.lexical import BM25Index
+
+    indexes = resources.lexical_indexes
+    index = indexes.get(filename, content_hash)
+    if index is not None:
+        return index
+    generation = indexes.generation(filename)
+    index = BM25Index()
+    async for key, chunk in resources.vector_store.iter_chunks(filename, content_hash):
+        index.add(key, chunk)
+    indexes.put(filename, content_hash, index, generation)
+    return index
+
+
+async def hybrid_search(
+    resources: "Resources",
+    filename: str,
+    query: str,
+    query_embedding: List[float],
+    k: int = 3,
+) -> List[dict]:
+    """Payloads of the ``k`` best chunks of ``filename`` for ``query``, best first."""
+    from aimakerspace.lexical import reciprocal_rank_fusion
+
+    store = resources.vector_store
+    n_candidates = max(k, resources.retrieval_candidates)
+    dense = await store.search(query_embedding, filename, n_candidates)
+    chunks = {hit.id: hit.payload for hit in dense}
+    if not resources.hybrid_search or not dense:
+        return list(chunks.values())[:k]
+    # The best dense hit tells which version of the PDF is stored
+    content_hash = dense[0].payload.get("content_hash")
+    lexical = (await lexical_index(resources, filename, content_hash)).search(query, n_candidates)
+    fused = reciprocal_rank_fusion(
+        [list(chunks), [key for key, _ in lexical]]
+    )[:k]
+    # Lexical-only hits still need their text
+    missing = [key for key, _ in fused if key not in chunks]
+    if missing:
+        chunks.update(await store.retrieve(missing))
+    return [chunks[key] for key, _ in fused if key in chunks]
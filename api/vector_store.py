@@ -0,0 +1,491 @@
+# Vector-store backends for indexed PDF chunks.
+#
+# upload_pdf and chat only talk to the small VectorStore interface below.
+# QdrantStore keeps the chunks in a Qdrant collection (local or hosted);
+# LocalStore keeps them in an in-process aimakerspace VectorDatabase that is
+# saved to disk, for offline use, tests and single-process deployments
+# without a network round trip per query. VECTOR_STORE selects one.
+#
+# Every point carries a payload with at least "filename", "content_hash"
+# (the document version) and "chunk" (its text).
+#
+# Next to the chunks each backend keeps the document catalog: one record per
+# indexed PDF ("filename", "content_hash", "chunks", "pages", "indexed_at"),
+# written by ingest and delete. Every instance reads the same records, so
+# listing documents neither scans chunks nor depends on local state.
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from qdrant_client import AsyncQdrantClient
+
+logger = logging.getLogger(__name__)
+
+VECTOR_SIZE = 1536  # for OpenAI embeddings
+
+# Namespace for uuid5 IDs of catalog records, one per filename
+RECORD_NAMESPACE = uuid.UUID("0b6f4c2e-8a1d-4f3b-9c7e-5d2a6e1f8b34")
+
+
+def document_record(filename: str, content_hash: str, chunks: int, pages: Optional[int]) -> dict:
+    """A catalog record of ``filename`` indexed now."""
+    return {
+        "filename": filename,
+        "content_hash": content_hash,
+        "chunks": chunks,
+        "pages": pages,
+        "indexed_at": time.time(),
+    }
+
+
+class Point(NamedTuple):
+    id: str
+    vector: List[float]
+    payload: dict
+
+
+class Hit(NamedTuple):
+    id: str
+    score: float
+    payload: dict
+
+
+class VectorStore(ABC):
+    """What the API needs from a vector store; see the module comment.
+
+    ``needs_backfill`` is set by :meth:`prepare` when it created the catalog
+    next to chunks stored without one, which then lack their records.
+    """
+
+    needs_backfill = False
+
+    @abstractmethod
+    async def prepare(self) -> None:
+        """Creates the collection (and its indexes) if missing."""
+
+    @abstractmethod
+    async def count_versions(self, filename: str, content_hash: str) -> Tuple[int, int]:
+        """Points of ``filename`` at ``content_hash``, and at other versions."""
+
+    @abstractmethod
+    async def upsert(self, points: Sequence[Point]) -> None:
+        """Adds ``points``, replacing any with the same IDs."""
+
+    @abstractmethod
+    async def delete_versions(self, filename: str, content_hash: str, keep: bool) -> None:
+        """Deletes the points of ``filename`` at every version other than
+        ``content_hash`` if ``keep``, else the points at ``content_hash``."""
+
+    @abstractmethod
+    async def delete_document(self, filename: str) -> int:
+        """Deletes every point of ``filename``; returns how many there were."""
+
+    async def flush(self) -> None:
+        """Makes preceding writes durable."""
+
+    @abstractmethod
+    async def search(self, vector: List[float], filename: str, limit: int) -> List[Hit]:
+        """The ``limit`` nearest chunks of ``filename``, best first."""
+
+    @abstractmethod
+    async def retrieve(self, ids: Sequence[str]) -> Dict[str, dict]:
+        """Payloads of the given point IDs (missing ones left out)."""
+
+    @abstractmethod
+    def iter_chunks(self, filename: str, content_hash: Optional[str] = None) -> AsyncIterator[Tuple[str, str]]:
+        """Yields ``(point id, chunk text)`` for every point of ``filename``
+        (only those at ``content_hash`` if given)."""
+
+    @abstractmethod
+    async def document_versions(self) -> List[Tuple[str, str, int]]:
+        """``(filename, content_hash, points)`` of every stored document
+        version. Scans the whole store; the catalog is the cheap way to
+        list documents."""
+
+    @abstractmethod
+    async def put_record(self, record: dict) -> None:
+        """Stores the catalog record of ``record["filename"]``, replacing
+        any previous one."""
+
+    @abstractmethod
+    async def remove_record(self, filename: str) -> bool:
+        """Drops ``filename``'s catalog record; returns whether there was one."""
+
+    @abstractmethod
+    async def get_record(self, filename: str) -> Optional[dict]:
+        """The catalog record of ``filename``, if any."""
+
+    @abstractmethod
+    async def records(self) -> List[dict]:
+        """Every catalog record, by filename."""
+
+    async def aclose(self) -> None:
+        pass
+
+
+def _match(field: str, value: str):
+    from qdrant_client.http import models as qmodels
+
+    return qmodels.FieldCondition(key=field, match=qmodels.MatchValue(value=value))
+
+
+class QdrantStore(VectorStore):
+    """Chunks in a Qdrant collection with keyword indexes on filename and
+    content_hash, and catalog records as payload-only points of a small
+    ``<collection>_documents`` collection. Collections and any missing index
+    are created on first use."""
+
+    def __init__(self, client: "AsyncQdrantClient", collection_name: str):
+        self.client = client
+        self.collection_name = collection_name
+        self.catalog_name = f"{collection_name}_documents"
+        self._ready = False
+        self._lock = asyncio.Lock()
+
+    async def prepare(self) -> None:
+        from qdrant_client.http import models as qmodels
+
+        if self._ready:
+            return
+        async with self._lock:
+            if self._ready:
+                return
+            chunks_exist = await self.client.collection_exists(self.collection_name)
+            if not chunks_exist:
+                await self.client.create_collection(
+                    collection_name=self.collection_name,
+                    vectors_config=qmodels.VectorParams(
+                        size=VECTOR_SIZE,
+                        distance=qmodels.Distance.COSINE,
+                    ),
+                )
+                logger.info("Collection '%s' created.", self.collection_name)
+            # Collections created before content_hash filtering lack its
+            # index; add whichever keyword index is missing
+            info = await self.client.get_collection(self.collection_name)
+            for field_name in ("filename", "content_hash"):
+                if field_name not in (info.payload_schema or {}):
+                    await self.client.create_payload_index(
+                        collection_name=self.collection_name,
+                        field_name=field_name,
+                        field_type="keyword",
+                    )
+                    logger.info("Created '%s' index on collection '%s'.", field_name, self.collection_name)
+            if not await self.client.collection_exists(self.catalog_name):
+                await self.client.create_collection(collection_name=self.catalog_name, vectors_config={})
+                logger.info("Collection '%s' created.", self.catalog_name)
+                self.needs_backfill = chunks_exist
+            self._ready = True
+
+    def _version_filter(self, filename: str, content_hash: str, same_version: bool):
+        from qdrant_client.http import models as qmodels
+
+        version = _match("content_hash", content_hash)
+        if same_version:
+            return qmodels.Filter(must=[_match("filename", filename), version])
+        return qmodels.Filter(must=[_match("filename", filename)], must_not=[version])
+
+    async def count_versions(self, filename: str, content_hash: str) -> Tuple[int, int]:
+        counts = [
+            await self.client.count(
+                collection_name=self.collection_name,
+                count_filter=self._version_filter(filename, content_hash, same_version),
+                exact=True,
+            )
+            for same_version in (True, False)
+        ]
+        return counts[0].count, counts[1].count
+
+    async def upsert(self, points: Sequence[Point]) -> None:
+        from qdrant_client.http import models as qmodels
+
+        await self.client.upsert(
+            collection_name=self.collection_name,
+            points=[
+                qmodels.PointStruct(id=point.id, vector=point.vector, payload=point.payload)
+                for point in points
+            ],
+        )
+
+    async def delete_versions(self, filename: str, content_hash: str, keep: bool) -> None:
+        from qdrant_client.http import models as qmodels
+
+        await self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=qmodels.FilterSelector(
+                filter=self._version_filter(filename, content_hash, same_version=not keep)
+            ),
+        )
+
+    async def delete_document(self, filename: str) -> int:
+        from qdrant_client.http import models as qmodels
+
+        document = qmodels.Filter(must=[_match("filename", filename)])
+        count = await self.client.count(
+            collection_name=self.collection_name, count_filter=document, exact=True
+        )
+        await self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=qmodels.FilterSelector(filter=document),
+        )
+        return count.count
+
+    async def search(self, vector: List[float], filename: str, limit: int) -> List[Hit]:
+        from qdrant_client.http import models as qmodels
+
+        result = await self.client.query_points(
+            collection_name=self.collection_name,
+            query=vector,
+            limit=limit,
+            query_filter=qmodels.Filter(must=[_match("filename", filename)]),
+            with_payload=True,
+        )
+        return [Hit(str(point.id), point.score, point.payload) for point in result.points]
+
+    async def retrieve(self, ids: Sequence[str]) -> Dict[str, dict]:
+        points = await self.client.retrieve(
+            collection_name=self.collection_name, ids=list(ids), with_payload=True
+        )
+        return {str(point.id): point.payload for point in points}
+
+    async def iter_chunks(self, filename: str, content_hash: Optional[str] = None) -> AsyncIterator[Tuple[str, str]]:
+        from qdrant_client.http import models as qmodels
+
+        must = [_match("filename", filename)]
+        if content_hash is not None:
+            must.append(_match("content_hash", content_hash))
+        offset = None
+        while True:
+            points, offset = await self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=qmodels.Filter(must=must),
+                limit=1000,
+                offset=offset,
+                with_payload=["chunk"],
+                with_vectors=False,
+            )
+            for point in points:
+                yield str(point.id), point.payload["chunk"]
+            if offset is None:
+                break
+
+    async def document_versions(self) -> List[Tuple[str, str, int]]:
+        versions = Counter()
+        offset = None
+        while True:
+            points, offset = await self.client.scroll(
+                collection_name=self.collection_name,
+                limit=1000,
+                offset=offset,
+                with_payload=["filename", "content_hash"],
+                with_vectors=False,
+            )
+            for point in points:
+                if "filename" in point.payload:
+                    versions[point.payload["filename"], point.payload.get("content_hash", "")] += 1
+            if offset is None:
+                break
+        return [(filename, content_hash, n) for (filename, content_hash), n in versions.items()]
+
+    @staticmethod
+    def _record_id(filename: str) -> str:
+        return str(uuid.uuid5(RECORD_NAMESPACE, filename))
+
+    async def put_record(self, record: dict) -> None:
+        from qdrant_client.http import models as qmodels
+
+        await self.prepare()
+        await self.client.upsert(
+            collection_name=self.catalog_name,
+            points=[qmodels.PointStruct(id=self._record_id(record["filename"]), vector={}, payload=record)],
+        )
+
+    async def remove_record(self, filename: str) -> bool:
+        from qdrant_client.http import models as qmodels
+
+        await self.prepare()
+        record_id = self._record_id(filename)
+        found = await self.client.retrieve(collection_name=self.catalog_name, ids=[record_id], with_payload=False)
+        await self.client.delete(
+            collection_name=self.catalog_name, points_selector=qmodels.PointIdsList(points=[record_id])
+        )
+        return bool(found)
+
+    async def get_record(self, filename: str) -> Optional[dict]:
+        await self.prepare()
+        found = await self.client.retrieve(
+            collection_name=self.catalog_name, ids=[self._record_id(filename)], with_payload=True
+        )
+        return found[0].payload if found else None
+
+    async def records(self) -> List[dict]:
+        await self.prepare()
+        records = []
+        offset = None
+        while True:
+            points, offset = await self.client.scroll(
+                collection_name=self.catalog_name, limit=1000, offset=offset, with_payload=True
+            )
+            records.extend(point.payload for point in points)
+            if offset is None:
+                break
+        return sorted(records, key=lambda record: record["filename"])
+
+
+class LocalStore(VectorStore):
+    """Chunks in an in-process :class:`VectorDatabase` saved under ``path``,
+    catalog records in ``documents.json`` beside it.
+
+    Writes are serialized by a lock; :meth:`flush` saves whatever changed
+    (the whole VectorDatabase, the records) in a worker thread, and the
+    next start loads the vectors memory-mapped. Meant for a single process:
+    concurrent writers would overwrite each other's saves.
+    """
+
+    def __init__(self, path: Optional[str], embedding_model=None):
+        self.path = path
+        self.embedding_model = embedding_model
+        self.db = None
+        self._records: Dict[str, dict] = {}
+        self._lock = asyncio.Lock()
+        self._dirty = False
+        self._records_dirty = False
+
+    def _records_path(self) -> str:
+        return os.path.join(self.path, "documents.json")
+
+    def _load_records(self) -> Optional[Dict[str, dict]]:
+        try:
+            with open(self._records_path(), encoding="utf-8") as f:
+                return {record["filename"]: record for record in json.load(f)}
+        except FileNotFoundError:
+            return None
+
+    def _save_records(self, records: List[dict]) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        path = self._records_path()
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(records, f)
+        os.replace(path + ".tmp", path)
+
+    async def prepare(self) -> None:
+        from aimakerspace.vectordatabase import VectorDatabase
+
+        if self.db is not None:
+            return
+        async with self._lock:
+            if self.db is not None:
+                return
+            if self.path and os.path.exists(os.path.join(self.path, "meta.json")):
+                db = await asyncio.to_thread(VectorDatabase.load, self.path, self.embedding_model)
+                records = await asyncio.to_thread(self._load_records)
+                self._records = records or {}
+                self.needs_backfill = records is None and len(db) > 0
+            else:
+                db = VectorDatabase(embedding_model=self.embedding_model, storage="matrix")
+            for field_name in ("filename", "content_hash"):
+                if field_name not in db.payload_indexes:
+                    db.create_payload_index(field_name)
+            self.db = db
+
+    def _versions(self, filename: str, content_hash: str) -> Tuple[List[str], List[str]]:
+        same, other = [], []
+        for key in self.db._filter_keys({"filename": filename}):
+            (same if self.db.payloads[key]["content_hash"] == content_hash else other).append(key)
+        return same, other
+
+    async def count_versions(self, filename: str, content_hash: str) -> Tuple[int, int]:
+        await self.prepare()
+        same, other = self._versions(filename, content_hash)
+        return len(same), len(other)
+
+    async def upsert(self, points: Sequence[Point]) -> None:
+        import numpy as np
+
+        await self.prepare()
+        async with self._lock:
+            for point in points:
+                self.db.insert(point.id, np.asarray(point.vector, dtype=np.float32), payload=point.payload)
+            self._dirty = True
+
+    async def delete_versions(self, filename: str, content_hash: str, keep: bool) -> None:
+        await self.prepare()
+        async with self._lock:
+            same, other = self._versions(filename, content_hash)
+            self._dirty |= bool(self.db.delete(other if keep else same))
+
+    async def delete_document(self, filename: str) -> int:
+        await self.prepare()
+        async with self._lock:
+            deleted = self.db.delete_by_filter({"filename": filename})
+            self._dirty |= bool(deleted)
+        return deleted
+
+    async def flush(self) -> None:
+        if not self.path or self.db is None:
+            return
+        async with self._lock:
+            if self._dirty:
+                await asyncio.to_thread(self.db.save, self.path)
+                self._dirty = False
+            if self._records_dirty:
+                await asyncio.to_thread(self._save_records, list(self._records.values()))
+                self._records_dirty = False
+
+    async def search(self, vector: List[float], filename: str, limit: int) -> List[Hit]:
+        import numpy as np
+
+        await self.prepare()
+        hits = self.db.query_points(np.asarray(vector, dtype=np.float32), limit, query_filter={"filename": filename})
+        return [Hit(hit.id, hit.score, hit.payload) for hit in hits]
+
+    async def retrieve(self, ids: Sequence[str]) -> Dict[str, dict]:
+        await self.prepare()
+        return {key: self.db.payloads[key] for key in ids if key in self.db.payloads}
+
+    async def iter_chunks(self, filename: str, content_hash: Optional[str] = None) -> AsyncIterator[Tuple[str, str]]:
+        await self.prepare()
+        query_filter = {"filename": filename}
+        if content_hash is not None:
+            query_filter["content_hash"] = content_hash
+        for key in self.db._filter_keys(query_filter):
+            yield key, self.db.payloads[key]["chunk"]
+
+    async def document_versions(self) -> List[Tuple[str, str, int]]:
+        await self.prepare()
+        versions = Counter(
+            (payload["filename"], payload.get("content_hash", ""))
+            for payload in self.db.payloads.values()
+            if "filename" in payload
+        )
+        return [(filename, content_hash, n) for (filename, content_hash), n in versions.items()]
+
+    async def put_record(self, record: dict) -> None:
+        await self.prepare()
+        self._records[record["filename"]] = dict(record)
+        self._records_dirty = True
+
+    async def remove_record(self, filename: str) -> bool:
+        await self.prepare()
+        removed = self._records.pop(filename, None) is not None
+        self._records_dirty |= removed
+        return removed
+
+    async def get_record(self, filename: str) -> Optional[dict]:
+        await self.prepare()
+        record = self._records.get(filename)
+        return None if record is None else dict(record)
+
+    async def records(self) -> List[dict]:
+        await self.prepare()
+        return [dict(self._records[filename]) for filename in sorted(self._records)]
+
+    async def aclose(self) -> None:
+        await self.flush()
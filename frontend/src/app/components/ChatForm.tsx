@@ -1,6 +1,6 @@
 "use client";
 
-import React, { useState } from 'react';
+import React, { useEffect, useState } from 'react';
 import styles from './ChatForm.module.css';
 
 interface ChatFormProps {
@@ -24,6 +24,69 @@ const getUploadApiUrl = () => {
   return '/api/upload_pdf';
 };
 
+const getJobApiUrl = (jobId: string) => {
+  if (typeof window !== 'undefined' && window.location.hostname === 'localhost') {
+    return `http://localhost:8000/api/jobs/${jobId}`;
+  }
+  return `/api/jobs/${jobId}`;
+};
+
+const getDocumentsApiUrl = () => {
+  if (typeof window !== 'undefined' && window.location.hostname === 'localhost') {
+    return 'http://localhost:8000/api/documents';
+  }
+  return '/api/documents';
+};
+
+// Give up on an upload that has not finished indexing after this long
+const JOB_TIMEOUT_MS = 10 * 60 * 1000;
+
+// Filenames of every indexed PDF, or null if the list cannot be read
+const fetchDocumentFilenames = async (): Promise<string[] | null> => {
+  const response = await fetch(getDocumentsApiUrl());
+  if (!response.ok) {
+    return null;
+  }
+  const data = await response.json();
+  return data.documents.map((document: { filename: string }) => document.filename);
+};
+
+// Poll a background indexing job until it finishes. Jobs live in the memory
+// of the server process that accepted the upload, so another instance (or
+// the same one after a restart) answers 404; then wait for the file to show
+// up in the document list instead
+const waitForJob = async (
+  jobId: string,
+  filename: string,
+  onProgress: (stage: string, chunks: number) => void
+) => {
+  const deadline = Date.now() + JOB_TIMEOUT_MS;
+  while (Date.now() < deadline) {
+    const response = await fetch(getJobApiUrl(jobId));
+    if (response.status === 404) {
+      const filenames = await fetchDocumentFilenames();
+      if (filenames && filenames.includes(filename)) {
+        return { filename, uploaded_filenames: filenames, analytics: null };
+      }
+      onProgress('indexing', 0);
+    } else {
+      const job = await response.json();
+      if (!response.ok) {
+        throw new Error(job.detail || 'Could not read upload job');
+      }
+      if (job.state === 'succeeded') {
+        return job.result;
+      }
+      if (job.state === 'failed') {
+        throw new Error(job.error || 'PDF indexing failed');
+      }
+      onProgress(job.stage, job.chunks);
+    }
+    await new Promise((resolve) => setTimeout(resolve, 1000));
+  }
+  throw new Error('PDF indexing is taking too long; check the document list later');
+};
+
 // Add a simple bar chart and word cloud component
 const BarChart: React.FC<{ data: { word: string; count: number }[] }> = ({ data }) => (
   <div style={{ width: '100%', maxWidth: 400, margin: '16px 0' }}>
@@ -73,6 +136,17 @@ const ChatForm: React.FC<ChatFormProps> = ({ onResponse }) => {
   const [selectedFilename, setSelectedFilename] = useState<string>('');
   const developerMessage = 'You are a pdf reader';
 
+  // PDFs indexed earlier can be chatted with without uploading them again
+  useEffect(() => {
+    fetchDocumentFilenames()
+      .then((filenames) => {
+        if (filenames) {
+          setUploadedFilenames(filenames);
+        }
+      })
+      .catch(() => {});
+  }, []);
+
   const modelOptions = [
     { value: 'gpt-4.1-mini', label: 'GPT-4.1 Mini' },
     { value: 'gpt-4o-mini', label: 'GPT-4o Mini' },
@@ -113,6 +187,10 @@ const ChatForm: React.FC<ChatFormProps> = ({ onResponse }) => {
       if (!response.ok) {
         throw new Error(data.detail || 'Upload failed');
       }
+      // Indexing runs as a background job; wait for its result
+      data = await waitForJob(data.job_id, data.filename, (stage, chunks) =>
+        setUploadStatus(`Indexing (${stage}, ${chunks} chunks)...`)
+      );
       setUploadStatus('Upload successful!');
       setAnalytics(data.analytics || null);
       if (data.uploaded_filenames) {